@@ -30,6 +30,8 @@ Response Format:
 """
 
 import runpod
+import asyncio
+import copy
 import json
 import base64
 import time
@@ -38,6 +40,8 @@ import os
 import uuid
 from pathlib import Path
 
+import aiohttp
+
 # ComfyUI imports
 import sys
 sys.path.insert(0, '/comfyui')
@@ -56,6 +60,16 @@ WORKFLOW_PATH = "/comfyui/workflows/ui-generation.json"
 OUTPUT_PATH = "/tmp/comfyui_output"
 LORA_PATH = "/comfyui/models/loras"
 
+# ComfyUI runs on localhost:8188 inside the container
+COMFYUI_URL = "http://127.0.0.1:8188"
+EXECUTION_TIMEOUT = 300  # 5 minutes max
+
+# Jobs awaited concurrently per worker; ComfyUI queues them internally
+MAX_CONCURRENCY = int(os.environ.get("KRIPTIK_MAX_CONCURRENCY", "4"))
+
+# Keep-alive session to ComfyUI (HTTP + websocket), created on the worker's event loop
+_session = None
+
 # Default generation parameters
 DEFAULT_PARAMS = {
     "width": 1024,
@@ -72,8 +86,8 @@ DEFAULT_PARAMS = {
 # ComfyUI Workflow Execution
 # =============================================================================
 
-def load_workflow():
-    """Load the UI generation workflow JSON."""
+def _read_workflow():
+    """Read and parse the UI generation workflow JSON from disk."""
     try:
         with open(WORKFLOW_PATH, 'r') as f:
             return json.load(f)
@@ -81,6 +95,27 @@ def load_workflow():
         print(f"Error loading workflow: {e}")
         return None
 
+def _index_nodes(workflow):
+    """
+    Map node roles to node IDs so requests can write inputs directly.
+
+    Roles are tagged explicitly in each node's _meta.role in the workflow JSON:
+    positive_prompt, negative_prompt, sampler, lora, latent.
+    """
+    return {
+        node['_meta']['role']: node_id
+        for node_id, node in workflow.items()
+        if isinstance(node, dict) and node.get('_meta', {}).get('role')
+    }
+
+# Parsed once per worker; requests deep-copy this template
+_WORKFLOW_TEMPLATE = _read_workflow()
+_NODE_INDEX = _index_nodes(_WORKFLOW_TEMPLATE) if _WORKFLOW_TEMPLATE else {}
+
+def load_workflow():
+    """Return the cached UI generation workflow template."""
+    return _WORKFLOW_TEMPLATE
+
 def modify_workflow(workflow, params):
     """
     Modify workflow nodes with request parameters.
@@ -92,44 +127,38 @@ def modify_workflow(workflow, params):
     - LoRA loader strength
     - Image dimensions
     """
-    workflow_copy = json.loads(json.dumps(workflow))
-
-    # Find and modify nodes by class type
-    for node_id, node in workflow_copy.items():
-        if isinstance(node, dict) and 'class_type' in node:
-            class_type = node['class_type']
-            inputs = node.get('inputs', {})
-
-            # Modify positive prompt
-            if class_type in ['CLIPTextEncode', 'CLIPTextEncodeFlux']:
-                if 'positive' in node_id.lower() or inputs.get('text', '').startswith('kriptik'):
-                    inputs['text'] = params.get('prompt', inputs.get('text', ''))
-                elif 'negative' in node_id.lower():
-                    inputs['text'] = params.get('negative_prompt', DEFAULT_PARAMS['negative_prompt'])
-
-            # Modify KSampler
-            elif class_type in ['KSampler', 'KSamplerAdvanced']:
-                inputs['steps'] = params.get('steps', DEFAULT_PARAMS['steps'])
-                inputs['cfg'] = params.get('cfg_scale', DEFAULT_PARAMS['cfg_scale'])
-                seed = params.get('seed', DEFAULT_PARAMS['seed'])
-                inputs['seed'] = seed if seed != -1 else random.randint(0, 2**32 - 1)
-
-            # Modify LoRA Loader
-            elif class_type == 'LoraLoader':
-                inputs['strength_model'] = params.get('lora_strength', DEFAULT_PARAMS['lora_strength'])
-                inputs['strength_clip'] = params.get('lora_strength', DEFAULT_PARAMS['lora_strength'])
-
-            # Modify EmptyLatentImage (dimensions)
-            elif class_type == 'EmptyLatentImage':
-                inputs['width'] = params.get('width', DEFAULT_PARAMS['width'])
-                inputs['height'] = params.get('height', DEFAULT_PARAMS['height'])
-                inputs['batch_size'] = params.get('batch_size', DEFAULT_PARAMS['batch_size'])
-
-            node['inputs'] = inputs
+    workflow_copy = copy.deepcopy(workflow)
+    index = _NODE_INDEX if workflow is _WORKFLOW_TEMPLATE else _index_nodes(workflow)
+
+    if 'positive_prompt' in index:
+        inputs = workflow_copy[index['positive_prompt']]['inputs']
+        inputs['text'] = params.get('prompt', inputs.get('text', ''))
+
+    if 'negative_prompt' in index:
+        inputs = workflow_copy[index['negative_prompt']]['inputs']
+        inputs['text'] = params.get('negative_prompt', DEFAULT_PARAMS['negative_prompt'])
+
+    if 'sampler' in index:
+        inputs = workflow_copy[index['sampler']]['inputs']
+        inputs['steps'] = params.get('steps', DEFAULT_PARAMS['steps'])
+        inputs['cfg'] = params.get('cfg_scale', DEFAULT_PARAMS['cfg_scale'])
+        seed = params.get('seed', DEFAULT_PARAMS['seed'])
+        inputs['seed'] = seed if seed != -1 else random.randint(0, 2**32 - 1)
+
+    if 'lora' in index:
+        inputs = workflow_copy[index['lora']]['inputs']
+        inputs['strength_model'] = params.get('lora_strength', DEFAULT_PARAMS['lora_strength'])
+        inputs['strength_clip'] = params.get('lora_strength', DEFAULT_PARAMS['lora_strength'])
+
+    if 'latent' in index:
+        inputs = workflow_copy[index['latent']]['inputs']
+        inputs['width'] = params.get('width', DEFAULT_PARAMS['width'])
+        inputs['height'] = params.get('height', DEFAULT_PARAMS['height'])
+        inputs['batch_size'] = params.get('batch_size', DEFAULT_PARAMS['batch_size'])
 
     return workflow_copy
 
-def execute_workflow(workflow):
+async def execute_workflow(workflow):
     """
     Execute the ComfyUI workflow and return generated images.
 
@@ -163,75 +192,93 @@ def execute_workflow(workflow):
         # Execute via ComfyUI CLI (if available) or API
         # Note: RunPod's worker may have its own execution method
 
-        return execute_via_api(workflow)
+        return await execute_via_api(workflow)
 
     except Exception as e:
         print(f"Workflow execution error: {e}")
         raise
 
-def execute_via_api(workflow):
+def _get_session():
+    """Return the shared aiohttp session, creating it on first use."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(base_url=COMFYUI_URL)
+    return _session
+
+async def execute_via_api(workflow):
     """
     Execute workflow via ComfyUI's internal API.
 
-    This is the standard method for RunPod workers.
+    This is the standard method for RunPod workers. Completion is detected
+    via ComfyUI's websocket push notifications rather than polling /history.
     """
-    import urllib.request
-    import urllib.parse
-
-    # ComfyUI runs on localhost:8188 inside the container
-    COMFYUI_URL = "http://127.0.0.1:8188"
+    session = _get_session()
+    client_id = str(uuid.uuid4())
 
     try:
-        # Queue the prompt
-        data = json.dumps({"prompt": workflow}).encode('utf-8')
-        req = urllib.request.Request(
-            f"{COMFYUI_URL}/prompt",
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
-
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode())
-            prompt_id = result.get('prompt_id')
-
-        # Poll for completion
-        max_polls = 300  # 5 minutes max
-        poll_count = 0
-
-        while poll_count < max_polls:
-            time.sleep(1)
-            poll_count += 1
-
-            # Check history for completion
-            history_req = urllib.request.Request(
-                f"{COMFYUI_URL}/history/{prompt_id}"
-            )
-
-            with urllib.request.urlopen(history_req) as response:
-                history = json.loads(response.read().decode())
-
-                if prompt_id in history:
-                    outputs = history[prompt_id].get('outputs', {})
-
-                    # Find SaveImage node outputs
-                    images = []
-                    for node_id, node_output in outputs.items():
-                        if 'images' in node_output:
-                            for img_info in node_output['images']:
-                                img_path = os.path.join(
-                                    COMFYUI_PATH,
-                                    'output',
-                                    img_info['filename']
-                                )
-                                if os.path.exists(img_path):
-                                    with open(img_path, 'rb') as f:
-                                        img_data = base64.b64encode(f.read()).decode('utf-8')
-                                        images.append(img_data)
-
-                    if images:
-                        return images
-
-        raise TimeoutError("Workflow execution timed out")
+        # Subscribe to execution events before queueing so none are missed.
+        # The context manager always closes the socket, even on timeout/error.
+        async with session.ws_connect(f"/ws?clientId={client_id}") as ws:
+            # Queue the prompt (client_id routes events back to our socket)
+            async with session.post(
+                "/prompt",
+                json={"prompt": workflow, "client_id": client_id},
+            ) as response:
+                response.raise_for_status()
+                prompt_id = (await response.json()).get('prompt_id')
+
+            # SaveImageWebsocket streams encoded PNG bytes as binary frames
+            output_nodes = {
+                node_id for node_id, node in workflow.items()
+                if isinstance(node, dict) and node.get('class_type') == 'SaveImageWebsocket'
+            }
+
+            # Wait until ComfyUI reports our prompt finished (node == None)
+            images = []
+            current_node = None
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + EXECUTION_TIMEOUT
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError("Workflow execution timed out")
+
+                try:
+                    message = await ws.receive(timeout=remaining)
+                except asyncio.TimeoutError:
+                    raise TimeoutError("Workflow execution timed out")
+
+                # Binary frames: 8-byte event/format header followed by image bytes.
+                # Only frames emitted while an output node runs are final images;
+                # the rest are sampler latent previews.
+                if message.type == aiohttp.WSMsgType.BINARY:
+                    if current_node in output_nodes:
+                        images.append(base64.b64encode(message.data[8:]).decode('utf-8'))
+                    continue
+
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    raise RuntimeError("ComfyUI websocket closed before execution finished")
+
+                event = json.loads(message.data)
+                event_data = event.get('data', {})
+
+                if event_data.get('prompt_id') != prompt_id:
+                    continue
+
+                if event.get('type') == 'executing':
+                    current_node = event_data.get('node')
+                    if current_node is None:
+                        break
+
+                elif event.get('type') == 'execution_error':
+                    raise RuntimeError(
+                        f"ComfyUI execution error: {event_data.get('exception_message', 'unknown error')}"
+                    )
+
+        if not images:
+            raise RuntimeError("Workflow completed without producing images")
+
+        return images
 
     except Exception as e:
         print(f"API execution error: {e}")
@@ -241,7 +288,7 @@ def execute_via_api(workflow):
 # RunPod Handler
 # =============================================================================
 
-def handler(job):
+async def handler(job):
     """
     Main handler for RunPod serverless requests.
 
@@ -282,7 +329,7 @@ def handler(job):
             used_seed = random.randint(0, 2**32 - 1)
 
         # Execute workflow
-        images = execute_workflow(modified_workflow)
+        images = await execute_workflow(modified_workflow)
 
         inference_time = time.time() - start_time
 
@@ -320,4 +367,7 @@ if __name__ == "__main__":
         print(f"VRAM: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB")
 
     # Start RunPod serverless worker
-    runpod.serverless.start({"handler": handler})
+    runpod.serverless.start({
+        "handler": handler,
+        "concurrency_modifier": lambda current_concurrency: MAX_CONCURRENCY,
+    })
@@ -2,8 +2,8 @@
 KripTik UI Generator - RunPod Serverless Handler (Diffusers Version v1.4)
 
 Handles UI mockup generation using FLUX.1-dev + UI-Design-LoRA via Diffusers.
-Uses CPU offloading for memory efficiency (works with LoRA, unlike quantization).
-Targets 32GB+ GPUs for 1024x1024, 24GB for 512x512.
+Keeps the full bf16 pipeline on 40GB+ GPUs, uses model CPU offload on 32GB GPUs,
+and an NF4-quantized transformer (LoRA applied on top in bf16) on 24GB GPUs.
 
 Request Format:
 {
@@ -14,27 +14,42 @@ Request Format:
         "steps": 8,
         "guidance_scale": 3.5,
         "lora_strength": 0.85,
-        "seed": -1
+        "seed": -1,
+        "output_format": "png"
     }
 }
 """
 
 import runpod
 import torch
+import asyncio
 import base64
 import time
 import random
 import os
 import gc
+import contextlib
+import concurrent.futures
+import functools
 from io import BytesIO
 from PIL import Image
 
+# Inference only: no autograd bookkeeping, TF32 matmuls, cuDNN autotuning for VAE convs
+torch.set_grad_enabled(False)
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.benchmark = True
+
 # Global model reference for persistence between requests
 pipe = None
 LORA_LOADED = False
+LORA_FUSED_SCALE = None
+BATCHING_ENABLED = False
+TRANSFORMER_COMPILED = False
+SDPA_BACKENDS = None
 
 # Configuration
-FLUX_MODEL = "black-forest-labs/FLUX.1-dev"
+# Local path when weights are baked into the image, otherwise the Hub repo ID
+FLUX_MODEL = os.environ.get("FLUX_MODEL", "black-forest-labs/FLUX.1-dev")
 LORA_PATH = "/workspace/loras/ui-design-lora.safetensors"
 
 def clear_memory():
@@ -42,7 +57,6 @@ def clear_memory():
     gc.collect()
     if torch.cuda.is_available():
         torch.cuda.empty_cache()
-        torch.cuda.synchronize()
 
 # Get HF token and log for debugging
 HF_TOKEN = os.environ.get("HF_TOKEN", "")
@@ -65,15 +79,34 @@ DEFAULT_PARAMS = {
     "guidance_scale": 3.5,
     "lora_strength": 0.85,
     "seed": -1,
+    "output_format": "png",
     "negative_prompt": "blurry, low quality, distorted text, broken layout, watermark, signature"
 }
 
 TRIGGER_WORD = "kriptik_ui"
 
+# Request coalescing (full GPU mode only): concurrent jobs with the same
+# shape/steps/guidance/LoRA strength share one pipeline forward pass
+MAX_BATCH = int(os.environ.get("KRIPTIK_MAX_BATCH", "4"))
+BATCH_WINDOW_MS = int(os.environ.get("KRIPTIK_BATCH_WINDOW_MS", "20"))
+_batch_queue = None
+_batch_task = None
+
+# Every pipeline call, warm-up included, runs on this single thread: the CUDA
+# graph trees recorded by reduce-overhead are thread-local, so graphs captured
+# on one thread are not replayed by calls made from another
+_gpu_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ui-generator-gpu")
+
+# PIL save options per output format: fast zlib level for PNG, libwebp for WebP
+IMAGE_SAVE_OPTIONS = {
+    "png": {"format": "PNG", "compress_level": 1},
+    "webp": {"format": "WEBP", "quality": 92, "method": 4},
+}
+
 
 def load_model():
-    """Load FLUX model with LoRA on first request using CPU offloading for memory efficiency."""
-    global pipe, LORA_LOADED
+    """Load FLUX model with LoRA, picking full GPU, CPU offload, or NF4 by available VRAM."""
+    global pipe, LORA_LOADED, LORA_FUSED_SCALE, BATCHING_ENABLED, TRANSFORMER_COMPILED, SDPA_BACKENDS
 
     if pipe is not None:
         return pipe
@@ -82,19 +115,48 @@ def load_model():
     print(f"[UI-Generator] GPU: {torch.cuda.get_device_name(0) if torch.cuda.is_available() else 'N/A'}")
     vram_total = torch.cuda.get_device_properties(0).total_memory / 1e9
     print(f"[UI-Generator] VRAM Total: {vram_total:.1f}GB")
-    start = time.time()
 
-    # Clear memory before loading
-    clear_memory()
+    # Ampere+ has FlashAttention-2 kernels; restrict SDPA to them so it never
+    # falls back to the math path that materializes the attention matrix
+    if torch.cuda.get_device_capability(0) >= (8, 0):
+        from torch.nn.attention import SDPBackend
+        SDPA_BACKENDS = [SDPBackend.FLASH_ATTENTION]
+    start = time.time()
 
     from diffusers import FluxPipeline
 
-    # Load pipeline in bfloat16 (no quantization for LoRA compatibility)
+    pipeline_kwargs = {}
+    if vram_total < 30:
+        # 24GB GPUs: 4-bit NF4 transformer weights fit on-GPU, avoiding the
+        # per-layer PCIe traffic of sequential CPU offload
+        from diffusers import BitsAndBytesConfig, FluxTransformer2DModel
+
+        print(f"[UI-Generator] Loading NF4-quantized transformer...")
+        pipeline_kwargs["transformer"] = FluxTransformer2DModel.from_pretrained(
+            FLUX_MODEL,
+            subfolder="transformer",
+            quantization_config=BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=torch.bfloat16,
+            ),
+            torch_dtype=torch.bfloat16,
+            use_safetensors=True,
+            low_cpu_mem_usage=True,
+            token=HF_TOKEN if HF_TOKEN else None,
+        )
+
+    # Load remaining components in bfloat16. safetensors + low_cpu_mem_usage
+    # mmap the shards and materialize weights straight into their final
+    # tensors instead of staging a full pickle-deserialized copy in RAM.
     print(f"[UI-Generator] Loading pipeline in bfloat16...")
     pipe = FluxPipeline.from_pretrained(
         FLUX_MODEL,
         torch_dtype=torch.bfloat16,
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
         token=HF_TOKEN if HF_TOKEN else None,
+        **pipeline_kwargs,
     )
 
     # Load LoRA BEFORE enabling offloading
@@ -104,6 +166,13 @@ def load_model():
             pipe.load_lora_weights(LORA_PATH, adapter_name="ui-design")
             LORA_LOADED = True
             print(f"[UI-Generator] LoRA loaded successfully")
+
+            # Fuse into the bf16 base weights so forwards skip the adapter path
+            # (quantized transformers keep the runtime-scaled adapter instead)
+            if "transformer" not in pipeline_kwargs:
+                pipe.fuse_lora(lora_scale=DEFAULT_PARAMS["lora_strength"])
+                LORA_FUSED_SCALE = DEFAULT_PARAMS["lora_strength"]
+                print(f"[UI-Generator] LoRA fused at scale {LORA_FUSED_SCALE}")
         except Exception as e:
             print(f"[UI-Generator] Warning: Failed to load LoRA: {e}")
             import traceback
@@ -112,19 +181,36 @@ def load_model():
     else:
         print(f"[UI-Generator] Warning: LoRA not found at {LORA_PATH}")
 
+    # NHWC layout lets cuDNN pick faster conv kernels for the VAE decoder
+    pipe.vae = pipe.vae.to(memory_format=torch.channels_last)
+
+    # Pin the transformer to the fused SDPA attention processor
+    from diffusers.models.attention_processor import FluxAttnProcessor2_0
+    pipe.transformer.set_attn_processor(FluxAttnProcessor2_0())
+
     # Choose offloading strategy based on VRAM
     if vram_total >= 40:
         # 48GB GPUs: Can keep everything on GPU
         print(f"[UI-Generator] Using full GPU mode (48GB+ available)")
         pipe = pipe.to("cuda")
+        BATCHING_ENABLED = MAX_BATCH > 1
+        # Compile the transformer (dominant per-step cost); CUDA graph capture via
+        # reduce-overhead is incompatible with the offload modes below.
+        # dynamic=False specializes on batch size, so keep room for one graph per size
+        print(f"[UI-Generator] Compiling transformer (reduce-overhead)")
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, MAX_BATCH)
+        pipe.transformer = torch.compile(
+            pipe.transformer, mode="reduce-overhead", fullgraph=False, dynamic=False
+        )
+        TRANSFORMER_COMPILED = True
     elif vram_total >= 30:
         # 32GB GPUs: Use model CPU offload (faster than sequential)
         print(f"[UI-Generator] Using model CPU offload (32GB mode)")
         pipe.enable_model_cpu_offload()
     else:
-        # 24GB GPUs: Use sequential CPU offload (slower but fits)
-        print(f"[UI-Generator] Using sequential CPU offload (24GB mode)")
-        pipe.enable_sequential_cpu_offload()
+        # 24GB GPUs: NF4 transformer + bf16 encoders/VAE fit without offloading
+        print(f"[UI-Generator] Using NF4 transformer on GPU (24GB mode)")
+        pipe = pipe.to("cuda")
 
     clear_memory()
     print(f"[UI-Generator] Model loaded in {time.time() - start:.1f}s")
@@ -132,7 +218,196 @@ def load_model():
     return pipe
 
 
-def handler(job):
+WARMUP_STEPS = 3
+
+
+def _warmup_pass(model, batch_size):
+    """Run one short generation at the default shape for the given batch size."""
+    # Encode outside _sdpa_context, as _run_pipeline does: CLIP passes an
+    # explicit causal mask, which the FlashAttention-only backend rejects
+    prompt_embeds, pooled_prompt_embeds = _encode_prompt("warmup", DEFAULT_PARAMS["lora_strength"])
+
+    # reduce-overhead warms up on the first transformer call, records the CUDA
+    # graph on the second and replays from the third, so run enough steps for
+    # the capture to happen here rather than on the first user request.
+    with torch.inference_mode(), _sdpa_context():
+        model(
+            prompt_embeds=prompt_embeds.repeat(batch_size, 1, 1),
+            pooled_prompt_embeds=pooled_prompt_embeds.repeat(batch_size, 1),
+            width=DEFAULT_PARAMS["width"],
+            height=DEFAULT_PARAMS["height"],
+            num_inference_steps=WARMUP_STEPS,
+            guidance_scale=0.0,
+            generator=torch.Generator("cuda").manual_seed(0),
+        )
+
+
+def warmup():
+    """Load the model and run short generations so the first requests are warm."""
+    model = load_model()
+    # The transformer is compiled with dynamic=False, so each batch size the
+    # coalescer can form is a separate graph; capture all of them up front
+    batch_sizes = range(1, MAX_BATCH + 1) if BATCHING_ENABLED else [1]
+    for batch_size in batch_sizes:
+        start = time.time()
+        _gpu_executor.submit(_warmup_pass, model, batch_size).result()
+        print(f"[UI-Generator] Warm-up pass (batch {batch_size}) completed in {time.time() - start:.1f}s")
+
+
+def encode_image_b64(image, output_format):
+    """Encode a PIL image to a base64 string in the requested format."""
+    buffer = BytesIO()
+    image.save(buffer, **IMAGE_SAVE_OPTIONS[output_format])
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def _refuse_lora(model, scale):
+    """Re-fuse the LoRA at a new scale; a no-op when the scale is unchanged (uncompiled only)."""
+    global LORA_FUSED_SCALE
+
+    if scale == LORA_FUSED_SCALE:
+        return
+
+    model.unfuse_lora()
+    model.fuse_lora(lora_scale=scale)
+    LORA_FUSED_SCALE = scale
+    print(f"[UI-Generator] LoRA re-fused at scale {scale}")
+
+
+def _sdpa_context():
+    """Restrict SDPA to FlashAttention when supported, otherwise a no-op context."""
+    if SDPA_BACKENDS is None:
+        return contextlib.nullcontext()
+    from torch.nn.attention import sdpa_kernel
+    return sdpa_kernel(SDPA_BACKENDS)
+
+
+@functools.lru_cache(maxsize=64)
+def _encode_prompt(prompt, lora_strength):
+    """
+    Encode a prompt with CLIP-L + T5-XXL.
+
+    Cached by (prompt, lora_strength) so UI iteration on the same prompt with
+    new seeds skips both text encoders. lora_strength is part of the key because
+    the LoRA also adapts the text encoder.
+    """
+    lora_scale = lora_strength if LORA_LOADED and LORA_FUSED_SCALE is None else None
+    with torch.inference_mode():
+        prompt_embeds, pooled_prompt_embeds, _ = pipe.encode_prompt(
+            prompt=prompt,
+            prompt_2=None,
+            lora_scale=lora_scale,
+        )
+    return prompt_embeds, pooled_prompt_embeds
+
+
+def _run_pipeline(model, requests):
+    """Run one pipeline call for a list of compatible generation requests."""
+    first = requests[0]
+
+    # Apply LoRA strength: re-fuse if it differs from the fused scale, otherwise
+    # pass it through joint_attention_kwargs for an unfused adapter
+    joint_attention_kwargs = None
+    if LORA_FUSED_SCALE is not None:
+        _refuse_lora(model, first["lora_strength"])
+    elif LORA_LOADED:
+        joint_attention_kwargs = {"scale": first["lora_strength"]}
+
+    embeds = [_encode_prompt(r["prompt"], r["lora_strength"]) for r in requests]
+
+    gen_kwargs = {
+        "prompt_embeds": torch.cat([e[0] for e in embeds]),
+        "pooled_prompt_embeds": torch.cat([e[1] for e in embeds]),
+        "width": first["width"],
+        "height": first["height"],
+        "num_inference_steps": first["steps"],
+        "guidance_scale": first["guidance_scale"],
+        "generator": [torch.Generator("cuda").manual_seed(r["seed"]) for r in requests],
+    }
+    if joint_attention_kwargs is not None:
+        gen_kwargs["joint_attention_kwargs"] = joint_attention_kwargs
+
+    with torch.inference_mode(), _sdpa_context():
+        return model(**gen_kwargs).images
+
+
+async def _run_on_gpu_thread(model, requests):
+    """Run _run_pipeline on the dedicated GPU thread without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_gpu_executor, _run_pipeline, model, requests)
+
+
+def _batch_key(request):
+    """Requests can share a forward pass only if everything but prompt/seed matches."""
+    return (
+        request["width"],
+        request["height"],
+        request["steps"],
+        request["guidance_scale"],
+        request["lora_strength"],
+    )
+
+
+async def _batch_loop(model):
+    """Collect queued requests for up to BATCH_WINDOW_MS and run them together."""
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_MS / 1000
+
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        groups = {}
+        for request, future in batch:
+            groups.setdefault(_batch_key(request), []).append((request, future))
+
+        for group in groups.values():
+            requests = [request for request, _ in group]
+            if len(requests) > 1:
+                print(f"[UI-Generator] Coalesced {len(requests)} requests into one batch")
+            try:
+                images = await _run_on_gpu_thread(model, requests)
+            except Exception as e:
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), image in zip(group, images):
+                if not future.done():
+                    future.set_result(image)
+
+
+async def generate(model, request):
+    """Generate one image, coalescing with concurrent requests when batching is enabled."""
+    global _batch_queue, _batch_task
+
+    if not BATCHING_ENABLED:
+        images = await _run_on_gpu_thread(model, [request])
+        return images[0]
+
+    if _batch_task is None or _batch_task.done():
+        _batch_queue = asyncio.Queue()
+        _batch_task = asyncio.create_task(_batch_loop(model))
+
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((request, future))
+    return await future
+
+
+def concurrency_modifier(current_concurrency):
+    """Accept up to MAX_BATCH concurrent jobs per worker when batching is enabled."""
+    return MAX_BATCH if BATCHING_ENABLED else 1
+
+
+async def handler(job):
     """Main handler for RunPod serverless requests."""
     start_time = time.time()
 
@@ -155,6 +430,10 @@ def handler(job):
         guidance_scale = job_input.get("guidance_scale", DEFAULT_PARAMS["guidance_scale"])
         lora_strength = job_input.get("lora_strength", DEFAULT_PARAMS["lora_strength"])
         seed = job_input.get("seed", DEFAULT_PARAMS["seed"])
+        output_format = str(job_input.get("output_format", DEFAULT_PARAMS["output_format"])).lower()
+
+        if output_format not in IMAGE_SAVE_OPTIONS:
+            return {"error": f"Unsupported output_format '{output_format}' (use 'png' or 'webp')"}
 
         if seed == -1:
             seed = random.randint(0, 2**32 - 1)
@@ -166,32 +445,28 @@ def handler(job):
         # Load model (cached after first request)
         model = load_model()
 
-        # Generate
-        generator = torch.Generator("cuda").manual_seed(seed)
+        # The compiled transformer's CUDA graphs were captured against the weights
+        # fused at load; re-fusing would rewrite them under the graphs, so the
+        # fused strength is used and reported instead of the requested one
+        if TRANSFORMER_COMPILED and LORA_FUSED_SCALE is not None and lora_strength != LORA_FUSED_SCALE:
+            print(f"[UI-Generator] LoRA strength {lora_strength} clamped to fused {LORA_FUSED_SCALE}")
+            lora_strength = LORA_FUSED_SCALE
 
         gen_start = time.time()
 
-        # Build generation kwargs
-        gen_kwargs = {
+        image = await generate(model, {
             "prompt": prompt,
             "width": width,
             "height": height,
-            "num_inference_steps": steps,
+            "steps": steps,
             "guidance_scale": guidance_scale,
-            "generator": generator,
-        }
-
-        # Add LoRA scale if loaded (via joint_attention_kwargs for FLUX)
-        if LORA_LOADED:
-            gen_kwargs["joint_attention_kwargs"] = {"scale": lora_strength}
-
-        image = model(**gen_kwargs).images[0]
+            "lora_strength": lora_strength,
+            "seed": seed,
+        })
         gen_time = time.time() - gen_start
 
-        # Convert to base64
-        buffer = BytesIO()
-        image.save(buffer, format="PNG")
-        img_base64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+        # Encode on a worker thread so the next job's GPU work can start meanwhile
+        img_base64 = await asyncio.to_thread(encode_image_b64, image, output_format)
 
         total_time = time.time() - start_time
         print(f"[UI-Generator] Generated in {gen_time:.1f}s (total: {total_time:.1f}s)")
@@ -199,6 +474,7 @@ def handler(job):
         return {
             "images": [img_base64],
             "seeds": [seed],
+            "format": output_format,
             "inference_time": gen_time,
             "total_time": total_time,
             "prompt": prompt,
@@ -216,6 +492,9 @@ def handler(job):
         print(f"[UI-Generator] Error: {e}")
         import traceback
         traceback.print_exc()
+        # Release cached blocks so the worker can recover from OOMs
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
         return {"error": str(e)}
 
 
@@ -226,4 +505,14 @@ if __name__ == "__main__":
     if torch.cuda.is_available():
         print(f"[UI-Generator] GPU: {torch.cuda.get_device_name(0)}")
 
-    runpod.serverless.start({"handler": handler})
+        # Load weights and populate kernel caches before the first job is routed
+        if os.environ.get("KRIPTIK_WARMUP", "1") == "1":
+            try:
+                warmup()
+            except Exception as e:
+                print(f"[UI-Generator] Warning: Warm-up failed: {e}")
+
+    runpod.serverless.start({
+        "handler": handler,
+        "concurrency_modifier": concurrency_modifier,
+    })
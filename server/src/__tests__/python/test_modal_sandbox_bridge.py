@@ -0,0 +1,136 @@
+"""
+Tests for the modal-sandbox-bridge sandbox store.
+
+The Modal SDK is replaced by a stub, so these run without modal installed.
+
+Run with: npm run test:python (from server/)
+"""
+
+import asyncio
+import contextlib
+import importlib.util
+import os
+import stat
+import sys
+import types
+
+import pytest
+
+BRIDGE_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "services", "cloud", "modal-sandbox-bridge.py"
+)
+
+
+class _FakeImage:
+    """Chainable stand-in for modal.Image; every builder call returns a new image"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: _FakeImage()
+
+
+class _FakeApp:
+    """Stand-in for modal.App; registered functions are returned unchanged"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def function(self, *args, **kwargs):
+        return lambda fn: fn
+
+    def run(self):
+        return contextlib.nullcontext()
+
+
+@pytest.fixture
+def bridge(tmp_path, monkeypatch):
+    """Load the bridge module against a stub modal SDK and a throwaway store"""
+    fake_modal = types.ModuleType("modal")
+    fake_modal.Image = types.SimpleNamespace(debian_slim=lambda **kwargs: _FakeImage())
+    fake_modal.App = _FakeApp
+    monkeypatch.setitem(sys.modules, "modal", fake_modal)
+    monkeypatch.setenv("KRIPTIK_SANDBOX_DB", str(tmp_path / "store" / "sandboxes.db"))
+
+    spec = importlib.util.spec_from_file_location("modal_sandbox_bridge", BRIDGE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module
+    if module._DB is not None:
+        module._DB.close()
+
+
+def _new_record(bridge, sandbox_id, config):
+    return bridge._record_from_config(
+        sandbox_id, f"kriptik-sandbox-{sandbox_id}", config, bridge.build_image_from_config(config)
+    )
+
+
+def test_store_and_load_round_trip(bridge):
+    config = {
+        "image": {"base": "node20", "pip_packages": ["requests"]},
+        "timeout": 900,
+        "memory": 2048,
+        "workdir": "/app",
+    }
+    record = _new_record(bridge, "sbx-1", config)
+    bridge._store_record(record, config)
+
+    loaded = bridge._load_record("sbx-1")
+
+    assert loaded is not None
+    # Same customized image, not the default kriptik image
+    assert loaded.image is record.image
+    assert loaded.image is not bridge.kriptik_image
+    assert loaded.image_config == config["image"]
+    assert loaded.image_key is None
+    assert (loaded.timeout, loaded.memory, loaded.workdir) == (900, 2048, "/app")
+    assert loaded.created_at == record.created_at
+    assert loaded.missing_env == []
+
+
+def test_store_keeps_env_values_out_of_the_database(bridge):
+    config = {"image": {"base": "debian"}, "env": {"OPENAI_API_KEY": "sk-secret"}}
+    bridge._store_record(_new_record(bridge, "sbx-2", config), config)
+
+    (config_json,) = bridge._db().execute(
+        "SELECT config_json FROM sandboxes WHERE id = ?", ("sbx-2",)
+    ).fetchone()
+    assert "sk-secret" not in config_json
+
+    loaded = bridge._load_record("sbx-2")
+    assert loaded.env == {}
+    assert loaded.missing_env == ["OPENAI_API_KEY"]
+
+
+def test_restored_sandbox_exec_requires_env(bridge):
+    config = {"image": {"base": "debian"}, "env": {"OPENAI_API_KEY": "sk-secret"}}
+    bridge._store_record(_new_record(bridge, "sbx-3", config), config)
+
+    response = asyncio.run(bridge.exec_in_sandbox({"sandboxId": "sbx-3", "command": ["true"]}))
+
+    assert not response["success"]
+    assert "OPENAI_API_KEY" in response["error"]
+    assert "sk-secret" not in response["error"]
+
+
+def test_store_is_owner_only(bridge):
+    bridge._db()
+    mode = stat.S_IMODE(os.stat(bridge.SANDBOX_DB_PATH).st_mode)
+    assert mode == 0o600
+    dir_mode = stat.S_IMODE(os.stat(os.path.dirname(bridge.SANDBOX_DB_PATH)).st_mode)
+    assert dir_mode & 0o077 == 0
+
+
+def test_unavailable_store_falls_back_to_memory(bridge, tmp_path, monkeypatch):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setattr(bridge, "SANDBOX_DB_PATH", str(blocker / "sandboxes.db"))
+
+    async def create_and_lookup():
+        created = await bridge.create_sandbox({"sandboxId": "sbx-4", "config": {}})
+        return created, await bridge._get_record("sbx-4")
+
+    created, record = asyncio.run(create_and_lookup())
+
+    assert created["success"]
+    assert record is not None
+    assert bridge._db() is None
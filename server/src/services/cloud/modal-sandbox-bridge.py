@@ -7,18 +7,25 @@ This bridge provides access to Modal's Python SDK operations that aren't
 available in the REST API. It receives JSON requests via stdin and returns
 JSON responses via stdout.
 
+By default a single JSON request is read and answered. With --serve the bridge
+stays running and speaks newline-delimited JSON: one request per line, one
+response per line, dispatched concurrently and matched by "requestId".
+
 Request Format:
 {
+    "requestId": "uuid (--serve mode)",
     "action": "create" | "exec" | "terminate" | "get_tunnel",
     "sandboxId": "uuid",
     "config": {...},
     "command": ["cmd", "arg1", "arg2"],
+    "env": {"KEY": "value"} (exec: merged over the sandbox env),
     "timeout": 300,
     "port": 5173
 }
 
 Response Format:
 {
+    "requestId": "uuid (--serve mode)",
     "success": true|false,
     "data": {...},
     "error": "error message if success=false"
@@ -28,7 +35,16 @@ Response Format:
 import sys
 import json
 import os
+import time
+import sqlite3
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import functools
+import threading
 import traceback
+from dataclasses import dataclass, field
 from typing import Dict, List, Any, Optional
 
 try:
@@ -40,6 +56,32 @@ except ImportError:
     }))
     sys.exit(1)
 
+# orjson encodes/decodes large exec outputs several times faster than stdlib
+# json; its JSONDecodeError subclasses json.JSONDecodeError
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
+    _loads = json.loads
+
+# Tracebacks are costly to format; only attach them when debugging
+DEBUG = os.environ.get("KRIPTIK_DEBUG", "0") == "1"
+
+
+def _err(msg: str, e: Exception) -> Dict[str, Any]:
+    """Error response for an exception, with a traceback under KRIPTIK_DEBUG=1"""
+    error = f"{msg}: {e!r}"
+    if DEBUG:
+        error += f"\n{traceback.format_exc()}"
+    return {"success": False, "error": error}
+
 # ============================================================================
 # MODAL IMAGE CONFIGURATIONS
 # ============================================================================
@@ -99,41 +141,324 @@ IMAGE_MAP = {
 
 app = modal.App("kriptik-sandbox-manager")
 
-# Global registry to track active sandboxes
-# In production, this would be persisted to a database
-ACTIVE_SANDBOXES: Dict[str, Dict[str, Any]] = {}
+
+def _run_command_impl(
+    cmd: List[str],
+    workdir: str,
+    env: Dict[str, str],
+    timeout: int,
+) -> Dict[str, Any]:
+    """Execute command in sandbox environment"""
+    import subprocess
+    import tempfile
+
+    try:
+        # Build logs can run to tens of MB; spooling to temp files lets the
+        # child write straight to disk instead of through a PIPE drain loop
+        with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+            result = subprocess.run(
+                cmd,
+                stdout=stdout,
+                stderr=stderr,
+                timeout=timeout,
+                cwd=workdir,
+                env={**os.environ, **env},
+            )
+            stdout.seek(0)
+            stderr.seek(0)
+
+            return {
+                "stdout": stdout.read().decode("utf-8", errors="replace"),
+                "stderr": stderr.read().decode("utf-8", errors="replace"),
+                "exit_code": result.returncode,
+            }
+    except subprocess.TimeoutExpired:
+        return {
+            "stdout": "",
+            "stderr": f"Command timed out after {timeout} seconds",
+            "exit_code": 124,
+        }
+    except Exception as e:
+        return {
+            "stdout": "",
+            "stderr": str(e),
+            "exit_code": 1,
+        }
+
+
+# Containers kept warm per exec image while the app runs (--serve mode keeps
+# it running); each holds its memory reservation, so off by default
+EXEC_KEEP_WARM = int(os.environ.get("KRIPTIK_EXEC_KEEP_WARM", "0"))
+
+# Exec functions registered once per base image, so execs reuse the running
+# app instead of registering a new function and booting an app per call
+EXEC_FUNCS = {
+    key: app.function(
+        image=image,
+        timeout=3600,
+        memory=8192,
+        keep_warm=EXEC_KEEP_WARM,
+        name=f"run_command_{key}",
+    )(_run_command_impl)
+    for key, image in IMAGE_MAP.items()
+}
+
+# Single app.run() context shared by every exec for the life of the bridge process
+_APP_CONTEXT = contextlib.ExitStack()
+_APP_RUNNING = False
+_APP_LOCK = threading.Lock()
+
+
+def _ensure_app_running() -> None:
+    """Enter the shared app context on first use; exited at process shutdown"""
+    global _APP_RUNNING
+    with _APP_LOCK:
+        if not _APP_RUNNING:
+            _APP_CONTEXT.enter_context(app.run())
+            atexit.register(_APP_CONTEXT.close)
+            _APP_RUNNING = True
+
+
+@dataclass(slots=True)
+class SandboxRecord:
+    """Registry entry for an active sandbox"""
+    sandbox_id: str
+    app_id: str
+    image: modal.Image
+    image_config: Dict[str, Any]
+    timeout: int
+    memory: int
+    cpu: int
+    encrypted_ports: List[int]
+    workdir: str
+    env: Dict[str, str]
+    block_network: bool
+    cidr_allowlist: List[str]
+    status: str = "running"
+    created_at: float = field(default_factory=time.time)
+    # EXEC_FUNCS key for base-only images; None means a customized image
+    image_key: Optional[str] = None
+    # Env var names a record restored from the store needs re-supplied
+    missing_env: List[str] = field(default_factory=list)
+
+
+def _exec_image_key(image_config: Dict[str, Any]) -> Optional[str]:
+    """Pre-registered exec function key for an image config, if it has one"""
+    if any(image_config.get(k) for k in ("pip_packages", "apt_packages", "custom_commands")):
+        return None
+    key = image_config.get("base", "custom")
+    return key if key in EXEC_FUNCS else None
+
+
+# Registry of active sandboxes, sharded so concurrent requests for different
+# sandboxes don't contend on a single lock. This is an in-process cache in
+# front of the SQLite store below, and the only registry when the store is
+# unavailable.
+_REGISTRY_SHARDS = 16
+_SHARDS: List[Dict[str, SandboxRecord]] = [{} for _ in range(_REGISTRY_SHARDS)]
+_LOCKS: List[asyncio.Lock] = [asyncio.Lock() for _ in range(_REGISTRY_SHARDS)]
+
+
+def _shard_index(sandbox_id: str) -> int:
+    """Registry shard holding this sandbox"""
+    return hash(sandbox_id) & (_REGISTRY_SHARDS - 1)
+
+
+# Persistent sandbox store. One-shot invocations start with an empty registry,
+# so records are written through to SQLite (WAL, shared across processes) and
+# rehydrated on a cache miss. It lives in a per-user directory, not shared /tmp.
+SANDBOX_DB_PATH = os.environ.get(
+    "KRIPTIK_SANDBOX_DB",
+    os.path.join(os.path.expanduser("~"), ".kriptik", "sandboxes.db"),
+)
+_DB: Optional[sqlite3.Connection] = None
+_DB_UNAVAILABLE = False
+
+# All store I/O runs on this one thread: it keeps SQLite off the event loop,
+# serializes use of the shared connection, and does not queue behind the
+# long-running execs in the default executor
+_STORE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="bridge-store")
+
+# Config fields persisted for rehydration. Env values (API keys) stay in
+# memory only; just their names are stored so a restore can ask for them.
+_PERSISTED_CONFIG_KEYS = (
+    "image", "timeout", "memory", "cpu", "encrypted_ports", "workdir",
+    "block_network", "cidr_allowlist",
+)
+
+
+def _db() -> Optional[sqlite3.Connection]:
+    """Lazily open the sandbox store (owner-only permissions); None if unavailable"""
+    global _DB, _DB_UNAVAILABLE
+    if _DB is None and not _DB_UNAVAILABLE:
+        try:
+            db_dir = os.path.dirname(os.path.abspath(SANDBOX_DB_PATH))
+            os.makedirs(db_dir, mode=0o700, exist_ok=True)
+            # Create the file 0600 before SQLite opens it; the WAL/SHM files inherit its mode
+            os.close(os.open(SANDBOX_DB_PATH, os.O_CREAT | os.O_RDWR, 0o600))
+            os.chmod(SANDBOX_DB_PATH, 0o600)
+            conn = sqlite3.connect(SANDBOX_DB_PATH, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sandboxes("
+                "id TEXT PRIMARY KEY, app_id TEXT, config_json TEXT, created_at REAL)"
+            )
+            _DB = conn
+        except (OSError, sqlite3.Error) as e:
+            _DB_UNAVAILABLE = True
+            print(
+                f"[Bridge] Warning: sandbox store {SANDBOX_DB_PATH} unavailable ({e}); "
+                "using the in-memory registry only",
+                file=sys.stderr,
+            )
+    return _DB
+
+
+def _store_execute(sql: str, params: tuple) -> Optional[sqlite3.Cursor]:
+    """Run one store statement; None when the store is unavailable or the statement fails"""
+    conn = _db()
+    if conn is None:
+        return None
+    try:
+        return conn.execute(sql, params)
+    except sqlite3.Error as e:
+        print(f"[Bridge] Warning: sandbox store error ({e}); continuing in memory", file=sys.stderr)
+        return None
+
+
+async def _on_store_thread(fn, *args):
+    """Run a blocking store function on the store thread"""
+    return await asyncio.get_running_loop().run_in_executor(_STORE_EXECUTOR, fn, *args)
+
+
+def _record_from_config(
+    sandbox_id: str,
+    app_id: str,
+    config: Dict[str, Any],
+    image: modal.Image,
+    created_at: Optional[float] = None,
+) -> SandboxRecord:
+    """Build a registry record from a create() config"""
+    return SandboxRecord(
+        sandbox_id=sandbox_id,
+        app_id=app_id,
+        image=image,
+        image_config=config.get("image", {}),
+        timeout=config.get("timeout", 3600),
+        memory=config.get("memory", 4096),
+        cpu=config.get("cpu", 2),
+        encrypted_ports=config.get("encrypted_ports", []),
+        workdir=config.get("workdir", "/workspace"),
+        env=config.get("env", {}),
+        block_network=config.get("block_network", False),
+        cidr_allowlist=config.get("cidr_allowlist", []),
+        created_at=created_at if created_at is not None else time.time(),
+        image_key=_exec_image_key(config.get("image", {})),
+    )
+
+
+def _store_record(record: SandboxRecord, config: Dict[str, Any]) -> None:
+    """Write a sandbox through to the persistent store, with env names but no values"""
+    persisted = {k: config[k] for k in _PERSISTED_CONFIG_KEYS if k in config}
+    persisted["env_keys"] = sorted(config.get("env", {}))
+    _store_execute(
+        "INSERT OR REPLACE INTO sandboxes (id, app_id, config_json, created_at) VALUES (?, ?, ?, ?)",
+        (record.sandbox_id, record.app_id, json.dumps(persisted), record.created_at),
+    )
+
+
+def _load_record(sandbox_id: str) -> Optional[SandboxRecord]:
+    """Rehydrate a sandbox from the persistent store; its env must be re-supplied"""
+    cursor = _store_execute(
+        "SELECT app_id, config_json, created_at FROM sandboxes WHERE id = ?",
+        (sandbox_id,),
+    )
+    row = cursor.fetchone() if cursor is not None else None
+    if row is None:
+        return None
+
+    app_id, config_json, created_at = row
+    config = json.loads(config_json)
+    record = _record_from_config(
+        sandbox_id,
+        app_id,
+        config,
+        build_image_from_config(config),
+        created_at,
+    )
+    record.missing_env = config.get("env_keys", [])
+    return record
+
+
+def _delete_record(sandbox_id: str) -> None:
+    """Remove a sandbox from the persistent store"""
+    _store_execute("DELETE FROM sandboxes WHERE id = ?", (sandbox_id,))
+
+
+async def _get_record(sandbox_id: str) -> Optional[SandboxRecord]:
+    """Look up a sandbox in the registry, falling back to the store"""
+    index = _shard_index(sandbox_id)
+    async with _LOCKS[index]:
+        record = _SHARDS[index].get(sandbox_id)
+    if record is not None:
+        return record
+
+    # Store I/O happens outside the shard lock
+    record = await _on_store_thread(_load_record, sandbox_id)
+    if record is None:
+        return None
+    async with _LOCKS[index]:
+        # A concurrent lookup may have cached it meanwhile; keep the first one
+        return _SHARDS[index].setdefault(sandbox_id, record)
+
 
 # ============================================================================
 # SANDBOX OPERATIONS
 # ============================================================================
 
-def build_image_from_config(config: Dict[str, Any]) -> modal.Image:
-    """Build a Modal image from configuration"""
-    image_config = config.get("image", {})
-    base = image_config.get("base", "custom")
+def _canonical_image_key(image_config: Dict[str, Any]) -> tuple:
+    """Hashable, order-insensitive key for an image configuration"""
+    return (
+        image_config.get("base", "custom"),
+        tuple(sorted(image_config.get("pip_packages", []))),
+        tuple(sorted(image_config.get("apt_packages", []))),
+        # Command order matters, so it is preserved
+        tuple(
+            cmd if isinstance(cmd, str) else tuple(cmd)
+            for cmd in image_config.get("custom_commands", [])
+        ),
+    )
+
+
+@functools.lru_cache(maxsize=128)
+def _build_image_cached(key: tuple) -> modal.Image:
+    """Build a Modal image from a canonical image key"""
+    base, pip_packages, apt_packages, custom_commands = key
 
     # Start with base image
     image = IMAGE_MAP.get(base, kriptik_image)
 
     # Add pip packages
-    pip_packages = image_config.get("pip_packages", [])
     if pip_packages:
         image = image.pip_install(*pip_packages)
 
     # Add apt packages
-    apt_packages = image_config.get("apt_packages", [])
     if apt_packages:
-        image = image.apt_install(apt_packages)
+        image = image.apt_install(list(apt_packages))
 
     # Add custom commands
-    custom_commands = image_config.get("custom_commands", [])
     for cmd in custom_commands:
-        image = image.run_commands(cmd)
+        image = image.run_commands(cmd if isinstance(cmd, str) else list(cmd))
 
     return image
 
 
-def create_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
+def build_image_from_config(config: Dict[str, Any]) -> modal.Image:
+    """Build a Modal image from configuration (memoized per distinct image config)"""
+    return _build_image_cached(_canonical_image_key(config.get("image", {})))
+
+
+async def create_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
     """Create a new Modal sandbox"""
     sandbox_id = request.get("sandboxId")
     config = request.get("config", {})
@@ -141,60 +466,36 @@ def create_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
     if not sandbox_id:
         raise ValueError("sandboxId is required")
 
-    # Build image from config
-    image = build_image_from_config(config)
-
-    # Get configuration options
-    timeout = config.get("timeout", 3600)
-    memory = config.get("memory", 4096)
-    cpu = config.get("cpu", 2)
-    encrypted_ports = config.get("encrypted_ports", [])
-    workdir = config.get("workdir", "/workspace")
-    env = config.get("env", {})
-    block_network = config.get("block_network", False)
-    cidr_allowlist = config.get("cidr_allowlist", [])
-
     # Create sandbox using Modal's Sandbox API
     try:
         # Note: Modal's Sandbox API creates ephemeral containers
         # We'll use a simple app function approach for now
-        sandbox_data = {
-            "sandbox_id": sandbox_id,
-            "app_id": f"kriptik-sandbox-{sandbox_id[:8]}",
-            "image": image,
-            "config": {
-                "timeout": timeout,
-                "memory": memory,
-                "cpu": cpu,
-                "encrypted_ports": encrypted_ports,
-                "workdir": workdir,
-                "env": env,
-                "block_network": block_network,
-                "cidr_allowlist": cidr_allowlist,
-            },
-            "status": "running",
-            "created_at": modal.current_time_str() if hasattr(modal, 'current_time_str') else "",
-        }
+        record = _record_from_config(
+            sandbox_id,
+            f"kriptik-sandbox-{sandbox_id[:8]}",
+            config,
+            build_image_from_config(config),
+        )
 
-        # Store in registry
-        ACTIVE_SANDBOXES[sandbox_id] = sandbox_data
+        # Store in registry and persist for later invocations
+        index = _shard_index(sandbox_id)
+        async with _LOCKS[index]:
+            _SHARDS[index][sandbox_id] = record
+        await _on_store_thread(_store_record, record, config)
 
         return {
             "success": True,
             "data": {
-                "app_id": sandbox_data["app_id"],
-                "status": "running",
+                "app_id": record.app_id,
+                "status": record.status,
                 "sandbox_id": sandbox_id,
             }
         }
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Failed to create sandbox: {str(e)}\n{traceback.format_exc()}"
-        }
+        return _err("Failed to create sandbox", e)
 
 
-def exec_in_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
+async def exec_in_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
     """Execute command in sandbox"""
     sandbox_id = request.get("sandboxId")
     command = request.get("command", [])
@@ -207,69 +508,70 @@ def exec_in_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
         raise ValueError("command is required")
 
     # Get sandbox from registry
-    sandbox_data = ACTIVE_SANDBOXES.get(sandbox_id)
-    if not sandbox_data:
+    record = await _get_record(sandbox_id)
+
+    if not record:
         return {
             "success": False,
             "error": f"Sandbox {sandbox_id} not found"
         }
 
+    # Env values are never persisted: a sandbox restored after a bridge
+    # restart runs nothing until the caller re-supplies them
+    request_env = request.get("env") or {}
+    missing_env = [key for key in record.missing_env if key not in request_env]
+    if missing_env:
+        return {
+            "success": False,
+            "error": (
+                f"Sandbox {sandbox_id} was restored without its environment; "
+                f"resend env with the exec request (missing: {', '.join(missing_env)})"
+            )
+        }
+
     try:
         # For this implementation, we'll use Modal's function execution
         # In a real scenario, this would use Modal's Sandbox.exec() method
-
-        @app.function(
-            image=sandbox_data["image"],
-            timeout=timeout,
-            memory=sandbox_data["config"].get("memory", 4096),
-        )
-        def run_command(cmd: List[str]) -> Dict[str, Any]:
-            """Execute command in sandbox environment"""
-            import subprocess
-
-            try:
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=timeout,
-                    cwd=sandbox_data["config"].get("workdir", "/workspace")
-                )
-
-                return {
-                    "stdout": result.stdout,
-                    "stderr": result.stderr,
-                    "exit_code": result.returncode,
-                }
-            except subprocess.TimeoutExpired:
-                return {
-                    "stdout": "",
-                    "stderr": f"Command timed out after {timeout} seconds",
-                    "exit_code": 124,
-                }
-            except Exception as e:
-                return {
-                    "stdout": "",
-                    "stderr": str(e),
-                    "exit_code": 1,
-                }
-
-        # Execute the function
-        with app.run():
-            result = run_command.remote(command)
+        workdir = record.workdir
+        env = {**record.env, **request_env}
+
+        if record.image_key is not None:
+            # Pre-registered function on the persistent app
+            await asyncio.to_thread(_ensure_app_running)
+            result = await asyncio.to_thread(
+                EXEC_FUNCS[record.image_key].remote, command, workdir, env, timeout
+            )
+        else:
+            # Customized images need their own function, which cannot be added
+            # to the already-running app, so use a one-off app
+            print(
+                f"[Bridge] Warning: sandbox {sandbox_id} uses a customized image; "
+                "exec falls back to a per-call app",
+                file=sys.stderr,
+            )
+            one_off_app = modal.App(f"kriptik-exec-{sandbox_id[:8]}")
+            run_command = one_off_app.function(
+                image=record.image,
+                timeout=timeout,
+                memory=record.memory,
+                serialized=True,
+            )(_run_command_impl)
+
+            def run_one_off() -> Dict[str, Any]:
+                with one_off_app.run():
+                    return run_command.remote(command, workdir, env, timeout)
+
+            result = await asyncio.to_thread(run_one_off)
 
         return {
             "success": True,
             "data": result
         }
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Command execution failed: {str(e)}\n{traceback.format_exc()}"
-        }
+        return _err("Command execution failed", e)
 
 
-def get_sandbox_tunnel(request: Dict[str, Any]) -> Dict[str, Any]:
+async def get_sandbox_tunnel(request: Dict[str, Any]) -> Dict[str, Any]:
     """Get tunnel URL for sandbox port"""
     sandbox_id = request.get("sandboxId")
     port = request.get("port", 5173)
@@ -278,8 +580,9 @@ def get_sandbox_tunnel(request: Dict[str, Any]) -> Dict[str, Any]:
         raise ValueError("sandboxId is required")
 
     # Get sandbox from registry
-    sandbox_data = ACTIVE_SANDBOXES.get(sandbox_id)
-    if not sandbox_data:
+    record = await _get_record(sandbox_id)
+
+    if not record:
         return {
             "success": False,
             "error": f"Sandbox {sandbox_id} not found"
@@ -288,7 +591,7 @@ def get_sandbox_tunnel(request: Dict[str, Any]) -> Dict[str, Any]:
     try:
         # Generate tunnel URL
         # In real implementation, this would use Modal's tunnel creation
-        app_id = sandbox_data["app_id"]
+        app_id = record.app_id
         tunnel_url = f"https://{app_id}--port-{port}.modal.run"
 
         return {
@@ -300,31 +603,32 @@ def get_sandbox_tunnel(request: Dict[str, Any]) -> Dict[str, Any]:
             }
         }
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Failed to get tunnel: {str(e)}\n{traceback.format_exc()}"
-        }
+        return _err("Failed to get tunnel", e)
 
 
-def terminate_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
+async def terminate_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
     """Terminate sandbox"""
     sandbox_id = request.get("sandboxId")
 
     if not sandbox_id:
         raise ValueError("sandboxId is required")
 
-    # Get sandbox from registry
-    sandbox_data = ACTIVE_SANDBOXES.get(sandbox_id)
-    if not sandbox_data:
+    # Remove from registry, then from the persistent store outside the shard lock
+    index = _shard_index(sandbox_id)
+    async with _LOCKS[index]:
+        record = _SHARDS[index].pop(sandbox_id, None)
+    if record is None:
+        record = await _on_store_thread(_load_record, sandbox_id)
+    if record is not None:
+        await _on_store_thread(_delete_record, sandbox_id)
+
+    if not record:
         return {
             "success": False,
             "error": f"Sandbox {sandbox_id} not found"
         }
 
     try:
-        # Remove from registry
-        del ACTIVE_SANDBOXES[sandbox_id]
-
         # In real implementation, this would call Modal's sandbox termination
         # Modal sandboxes are ephemeral and auto-terminate after timeout
 
@@ -336,17 +640,14 @@ def terminate_sandbox(request: Dict[str, Any]) -> Dict[str, Any]:
             }
         }
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Failed to terminate sandbox: {str(e)}\n{traceback.format_exc()}"
-        }
+        return _err("Failed to terminate sandbox", e)
 
 
 # ============================================================================
 # REQUEST DISPATCHER
 # ============================================================================
 
-def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
+async def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
     """Route request to appropriate handler"""
     action = request.get("action")
 
@@ -371,12 +672,9 @@ def handle_request(request: Dict[str, Any]) -> Dict[str, Any]:
         }
 
     try:
-        return handler(request)
+        return await handler(request)
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"Handler error: {str(e)}\n{traceback.format_exc()}"
-        }
+        return _err("Handler error", e)
 
 
 # ============================================================================
@@ -387,7 +685,7 @@ def main():
     """Main entry point - reads JSON from stdin, outputs JSON to stdout"""
     try:
         # Read request from stdin
-        input_data = sys.stdin.read()
+        input_data = sys.stdin.buffer.read()
 
         if not input_data.strip():
             response = {
@@ -396,8 +694,8 @@ def main():
             }
         else:
             try:
-                request = json.loads(input_data)
-                response = handle_request(request)
+                request = _loads(input_data)
+                response = asyncio.run(handle_request(request))
             except json.JSONDecodeError as e:
                 response = {
                     "success": False,
@@ -405,7 +703,8 @@ def main():
                 }
 
         # Output response to stdout
-        print(json.dumps(response))
+        sys.stdout.buffer.write(_dumps(response) + b"\n")
+        sys.stdout.buffer.flush()
 
     except Exception as e:
         # Last resort error handling
@@ -417,5 +716,66 @@ def main():
         sys.exit(1)
 
 
+# Dedicated reader thread: the default executor runs .remote() execs for up to
+# an hour each, and a reader queued behind them would stop accepting requests
+_STDIN_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="bridge-stdin")
+
+
+async def _aiter_stdin():
+    """Yield stdin lines (bytes) without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    while True:
+        line = await loop.run_in_executor(_STDIN_EXECUTOR, sys.stdin.buffer.readline)
+        if not line:
+            return
+        yield line
+
+
+def _write_response(response: Dict[str, Any]) -> None:
+    """Write one response line; only called from the event loop thread"""
+    sys.stdout.buffer.write(_dumps(response) + b"\n")
+    sys.stdout.buffer.flush()
+
+
+async def _serve_request(request: Dict[str, Any]) -> None:
+    """Handle one request and write its response tagged with the requestId"""
+    try:
+        response = await handle_request(request)
+    except Exception as e:
+        response = _err("Fatal error", e)
+    response["requestId"] = request.get("requestId")
+    _write_response(response)
+
+
+async def serve() -> None:
+    """Persistent mode - one JSON request per stdin line, handled concurrently"""
+    in_flight = set()
+
+    async for line in _aiter_stdin():
+        if not line.strip():
+            continue
+
+        try:
+            request = _loads(line)
+        except json.JSONDecodeError as e:
+            _write_response({
+                "requestId": None,
+                "success": False,
+                "error": f"Invalid JSON input: {str(e)}"
+            })
+            continue
+
+        task = asyncio.create_task(_serve_request(request))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+
+    # stdin closed: let in-flight requests finish before exiting
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
 if __name__ == "__main__":
-    main()
+    if "--serve" in sys.argv[1:]:
+        asyncio.run(serve())
+    else:
+        main()
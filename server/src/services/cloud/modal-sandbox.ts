@@ -71,11 +71,13 @@ interface PythonBridgeRequest {
   sandboxId?: string;
   config?: ModalSandboxConfig;
   command?: string[];
+  env?: Record<string, string>;
   timeout?: number;
   port?: number;
 }
 
 interface PythonBridgeResponse {
+  requestId?: string | null;
   success: boolean;
   data?: any;
   error?: string;
@@ -93,6 +95,10 @@ const DEFAULT_SANDBOX_CONFIG: Partial<ModalSandboxConfig> = {
   block_network: false,
 };
 
+// Bridge requests fail after this long without a response; exec requests get
+// their own command timeout on top so long-running commands are not cut short
+const BRIDGE_REQUEST_TIMEOUT_MS = 120_000;
+
 const KRIPTIK_BUILD_IMAGE: SandboxImageConfig = {
   base: 'debian',
   apt_packages: [
@@ -129,6 +135,15 @@ export class ModalSandboxService extends EventEmitter {
   private tokenSecret: string;
   private activeSandboxes: Map<string, ModalSandbox>;
   private pythonBridgePath: string;
+  private bridgeProcess: ChildProcess | null = null;
+  private pendingBridgeRequests = new Map<
+    string,
+    {
+      process: ChildProcess;
+      resolve: (response: PythonBridgeResponse) => void;
+      reject: (error: Error) => void;
+    }
+  >();
   private baseUrl = 'https://api.modal.com/v1';
 
   constructor(credentials: ModalSandboxCredentials) {
@@ -165,53 +180,145 @@ export class ModalSandboxService extends EventEmitter {
   }
 
   /**
-   * Execute Python bridge command
+   * Get the persistent Python bridge process, spawning it on first use.
+   *
+   * The bridge runs in --serve mode: one JSON request per stdin line, one
+   * JSON response per stdout line, matched back to callers by requestId.
+   * This avoids paying Python startup + `import modal` on every operation.
    */
-  private async executePythonBridge(request: PythonBridgeRequest): Promise<PythonBridgeResponse> {
-    return new Promise((resolve, reject) => {
-      const env = {
-        ...process.env,
-        MODAL_TOKEN_ID: this.tokenId,
-        MODAL_TOKEN_SECRET: this.tokenSecret,
-      };
+  private getBridgeProcess(): ChildProcess {
+    if (this.bridgeProcess) {
+      return this.bridgeProcess;
+    }
 
-      const python = spawn('python3', [this.pythonBridgePath], {
-        env,
-        stdio: ['pipe', 'pipe', 'pipe'],
-      });
+    const env = {
+      ...process.env,
+      MODAL_TOKEN_ID: this.tokenId,
+      MODAL_TOKEN_SECRET: this.tokenSecret,
+    };
 
-      let stdout = '';
-      let stderr = '';
+    const python = spawn('python3', [this.pythonBridgePath, '--serve'], {
+      env,
+      stdio: ['pipe', 'pipe', 'pipe'],
+    });
 
-      python.stdout.on('data', (data) => {
-        stdout += data.toString();
-      });
+    let stdoutBuffer = '';
+    let stderr = '';
 
-      python.stderr.on('data', (data) => {
-        stderr += data.toString();
-      });
+    // Decode as a stream so multi-byte UTF-8 characters split across chunks stay intact
+    python.stdout!.setEncoding('utf8');
+    python.stderr!.setEncoding('utf8');
 
-      python.on('error', (error) => {
-        reject(new Error(`Python bridge error: ${error.message}`));
-      });
+    python.stdout!.on('data', (data: string) => {
+      stdoutBuffer += data;
 
-      python.on('close', (code) => {
-        if (code !== 0) {
-          reject(new Error(`Python bridge exited with code ${code}: ${stderr}`));
-          return;
+      let newlineIndex: number;
+      while ((newlineIndex = stdoutBuffer.indexOf('\n')) !== -1) {
+        const line = stdoutBuffer.slice(0, newlineIndex);
+        stdoutBuffer = stdoutBuffer.slice(newlineIndex + 1);
+
+        if (!line.trim()) {
+          continue;
         }
 
+        let response: PythonBridgeResponse;
         try {
-          const response: PythonBridgeResponse = JSON.parse(stdout);
-          resolve(response);
+          response = JSON.parse(line);
         } catch (error) {
-          reject(new Error(`Failed to parse Python bridge response: ${stdout}`));
+          console.error(`[ModalSandbox] Failed to parse Python bridge response: ${line}`);
+          continue;
         }
-      });
 
-      python.stdin.write(JSON.stringify(request));
-      python.stdin.end();
+        const pending = response.requestId
+          ? this.pendingBridgeRequests.get(response.requestId)
+          : undefined;
+        if (pending) {
+          this.pendingBridgeRequests.delete(response.requestId!);
+          pending.resolve(response);
+        }
+      }
+    });
+
+    python.stderr!.on('data', (data: string) => {
+      // Keep only the tail for error reporting
+      stderr = (stderr + data).slice(-4096);
+    });
+
+    // Only reject requests sent to this process; a replacement bridge may
+    // already be serving newer requests by the time this one closes
+    const failPending = (error: Error) => {
+      for (const [requestId, pending] of this.pendingBridgeRequests) {
+        if (pending.process === python) {
+          this.pendingBridgeRequests.delete(requestId);
+          pending.reject(error);
+        }
+      }
+    };
+
+    // Writing to a bridge that just died emits EPIPE here; unhandled, it would crash Node
+    python.stdin!.on('error', (error) => {
+      if (this.bridgeProcess === python) {
+        this.bridgeProcess = null;
+      }
+      failPending(new Error(`Python bridge stdin error: ${error.message}`));
     });
+
+    python.on('error', (error) => {
+      if (this.bridgeProcess === python) {
+        this.bridgeProcess = null;
+      }
+      failPending(new Error(`Python bridge error: ${error.message}`));
+    });
+
+    python.on('close', (code) => {
+      if (this.bridgeProcess === python) {
+        this.bridgeProcess = null;
+      }
+      failPending(new Error(`Python bridge exited with code ${code}: ${stderr}`));
+    });
+
+    this.bridgeProcess = python;
+    return python;
+  }
+
+  /**
+   * Execute Python bridge command
+   */
+  private async executePythonBridge(request: PythonBridgeRequest): Promise<PythonBridgeResponse> {
+    const python = this.getBridgeProcess();
+    const requestId = uuidv4();
+
+    return new Promise((resolve, reject) => {
+      const timeoutMs = (request.timeout ?? 0) * 1000 + BRIDGE_REQUEST_TIMEOUT_MS;
+      const timer = setTimeout(() => {
+        if (this.pendingBridgeRequests.delete(requestId)) {
+          reject(new Error(`Python bridge request '${request.action}' timed out after ${timeoutMs}ms`));
+        }
+      }, timeoutMs);
+
+      this.pendingBridgeRequests.set(requestId, {
+        process: python,
+        resolve: (response) => {
+          clearTimeout(timer);
+          resolve(response);
+        },
+        reject: (error) => {
+          clearTimeout(timer);
+          reject(error);
+        },
+      });
+      python.stdin!.write(JSON.stringify({ ...request, requestId }) + '\n');
+    });
+  }
+
+  /**
+   * Stop the persistent Python bridge process
+   */
+  closeBridge(): void {
+    if (this.bridgeProcess) {
+      this.bridgeProcess.stdin?.end();
+      this.bridgeProcess = null;
+    }
   }
 
   // ========================================================================
@@ -288,6 +395,8 @@ export class ModalSandboxService extends EventEmitter {
         action: 'exec',
         sandboxId,
         command,
+        // Merged over the sandbox env; also re-supplies it after a bridge restart
+        env: options.env,
         timeout: options.timeout || 300,
       });
 
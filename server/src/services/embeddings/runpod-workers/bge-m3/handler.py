@@ -11,22 +11,290 @@ Max Tokens: 8192
 
 import runpod
 import torch
+import numpy as np
+import asyncio
+import base64
+import functools
 import os
+from torch.nn.utils.rnn import pad_sequence
 
 # Force safetensors loading to bypass CVE-2025-32434 torch.load restriction
 os.environ["SAFETENSORS_FAST_GPU"] = "1"
 os.environ["HF_HUB_DISABLE_TELEMETRY"] = "1"
+# Variable-length requests fragment the caching allocator; let segments grow
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+# Keep downloaded weights on the network volume when one is attached so a
+# recycled container skips the 2.3GB download (loaders import lazily, after this)
+if os.path.isdir("/runpod-volume"):
+    os.environ["HF_HOME"] = "/runpod-volume/hf_cache"
+
+if torch.cuda.is_available():
+    torch.backends.cuda.enable_flash_sdp(True)
+
+# Side stream for device->host copies of embeddings, off the compute stream
+COPY_STREAM = torch.cuda.Stream() if torch.cuda.is_available() else None
+
+# Weight precision, fixed at cold start: "fp16" (default on GPU), "fp32"
+# (default on CPU; the transformers fallback runs BF16 where the CPU supports
+# it) or "int8" (dynamic int8 Linear layers, CPU only, costs some fidelity)
+QUANT = os.environ.get("BGE_M3_QUANT", "fp16" if torch.cuda.is_available() else "fp32")
+
+# Optional ONNX Runtime backend for CPU-only workers (fused LayerNorm/GELU,
+# oneDNN kernels); the export is saved to the network volume and reused
+USE_ONNX = os.environ.get("BGE_M3_ONNX", "0") == "1"
+ONNX_CACHE_DIR = os.environ.get("BGE_M3_ONNX_DIR", "/runpod-volume/bge-m3-onnx")
+
+# Micro-batching: concurrent jobs with matching options arriving within
+# BATCH_WINDOW_MS are encoded together in one model.encode call
+MAX_CONCURRENCY = int(os.environ.get("BGE_M3_MAX_CONCURRENCY", "16"))
+BATCH_WINDOW_MS = int(os.environ.get("BGE_M3_BATCH_WINDOW_MS", "5"))
+ENCODE_BATCH_SIZE = 32
+# Token ids of short texts are cached (RAG queries repeat across refreshes);
+# long documents rarely repeat and would pin up to 8192 ids each, so they bypass it
+TOKENIZE_CACHE_SIZE = 4096
+TOKENIZE_CACHE_MAX_CHARS = 2048
+# Padded lengths on GPU: a handful of stable shapes for the compiled graphs
+LENGTH_BUCKETS = (256, 512, 1024, 2048, 4096, 8192)
+# Row counts the compiled (reduce-overhead) towers see: with LENGTH_BUCKETS this
+# caps the recorded CUDA graphs at 36 shapes instead of one per (rows, length)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, ENCODE_BATCH_SIZE)
+_batch_queue = None
+_batch_task = None
 
 # Global model instance (loaded once at cold start)
 model = None
-model_type = None  # 'flagembedding' or 'sentence_transformers'
+model_type = None  # 'onnx', 'flagembedding', 'sentence_transformers' or 'transformers'
+model_device = None
+# Token ids skipped in lexical weights (<s>, </s>, <pad>, <unk>, ...), set at load
+special_token_ids = frozenset()
+
+def _quantize_int8(module):
+    """Swap Linear layers for dynamically quantized int8 ones (CPU kernels)"""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _cpu_bf16_supported():
+    """Whether oneDNN has native BF16 kernels on this CPU (AVX512-BF16 / AMX)"""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+def _compile(module):
+    """torch.compile for the GPU forward pass; eager on CPU"""
+    if not torch.cuda.is_available():
+        return module
+    return torch.compile(module, mode="reduce-overhead", fullgraph=False)
+
+def _freeze_for_cpu(module):
+    """TorchScript trace + freeze + optimize_for_inference; stays eager if tracing fails"""
+    try:
+        dummy = tokenizer(["warmup text"] * 2, padding="max_length", max_length=512, return_tensors="pt")
+        with torch.no_grad():
+            traced = torch.jit.trace(module, (dummy["input_ids"], dummy["attention_mask"]), strict=False)
+            frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        print("[BGE-M3] Using frozen TorchScript model on CPU")
+        return frozen
+    except Exception as e:
+        print(f"[BGE-M3] TorchScript freeze failed, staying eager: {e}")
+        return module
+
+def _to_device(inputs, device):
+    """Move tokenizer/processor tensors to the device; pinned + async on CUDA"""
+    if device.type != "cuda":
+        return {k: v.to(device) for k, v in inputs.items()}
+    return {k: v.pin_memory().to(device, non_blocking=True) for k, v in inputs.items()}
+
+def _tokenize(text, max_length):
+    """Token ids for a single text as a 1-D CPU tensor"""
+    ids = tokenizer(text, truncation=True, max_length=max_length, return_attention_mask=False, return_token_type_ids=False)["input_ids"]
+    return torch.tensor(ids)
+
+_tokenize_cached = functools.lru_cache(maxsize=TOKENIZE_CACHE_SIZE)(_tokenize)
+
+def _tokenize_one(text, max_length):
+    """Token ids for a single text; only short texts go through the cache"""
+    if len(text) <= TOKENIZE_CACHE_MAX_CHARS:
+        return _tokenize_cached(text, max_length)
+    return _tokenize(text, max_length)
+
+def _collate(ids):
+    """Right-padded input_ids/attention_mask batch; GPU batches pad up to a LENGTH_BUCKETS size"""
+    input_ids = pad_sequence(ids, batch_first=True, padding_value=tokenizer.pad_token_id)
+    attention_mask = pad_sequence([torch.ones_like(i) for i in ids], batch_first=True)
+    longest = input_ids.shape[1]
+    if model_device.type == "cuda":
+        pad = next((b for b in LENGTH_BUCKETS if b >= longest), longest) - longest
+        input_ids = torch.nn.functional.pad(input_ids, (0, pad), value=tokenizer.pad_token_id)
+        attention_mask = torch.nn.functional.pad(attention_mask, (0, pad), value=0)
+        if model_type != 'flagembedding':
+            # Compiled towers: also pad rows up to a BATCH_BUCKETS size with copies of
+            # the first row (valid inputs, no fully-masked NaN rows); callers drop them
+            extra = next((b for b in BATCH_BUCKETS if b >= len(ids)), len(ids)) - len(ids)
+            if extra:
+                input_ids = torch.cat([input_ids, input_ids[:1].expand(extra, -1)])
+                attention_mask = torch.cat([attention_mask, attention_mask[:1].expand(extra, -1)])
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+def _sorted_batches(ids):
+    """Index order by token length, plus lazy (indices, device inputs) sub-batches in that order"""
+    # Sorting keeps similar lengths together so short texts aren't padded to the longest
+    order = sorted(range(len(ids)), key=lambda i: len(ids[i]))
+    chunks = [order[start:start + ENCODE_BATCH_SIZE] for start in range(0, len(order), ENCODE_BATCH_SIZE)]
+    return order, ((chunk, _to_device(_collate([ids[i] for i in chunk]), model_device)) for chunk in chunks)
+
+def _unsort_rows(order, rows):
+    """Concatenate per-batch [B, D] outputs and put the rows back in input order"""
+    dense = np.empty((len(order), rows[0].shape[1]), dtype=np.float32)
+    dense[order] = _to_host(torch.cat(rows).float())
+    return dense
+
+def _encode_manual(m, ids):
+    """Masked mean pooling over length-sorted sub-batches; rows returned in input order"""
+    order, batches = _sorted_batches(ids)
+    pooled = []
+    for chunk, inputs in batches:
+        # Positional call: a frozen TorchScript module has no kwargs or parameters
+        outputs = m(inputs["input_ids"], inputs["attention_mask"])
+        hidden = outputs["last_hidden_state"][:len(chunk)]
+        inputs = {k: v[:len(chunk)] for k, v in inputs.items()}
+        # Mask in the hidden dtype (no [B, N, D] FP32 copy); accumulate the sum in FP32
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        lengths = inputs["attention_mask"].sum(dim=1, keepdim=True).clamp(min=1)
+        pooled.append((hidden * mask).sum(dim=1, dtype=torch.float32) / lengths)
+    return _unsort_rows(order, pooled)
+
+def _encode_sentence_transformers(m, ids):
+    """SentenceTransformer module pipeline on pre-tokenized ids; rows returned in input order"""
+    order, batches = _sorted_batches(ids)
+    return _unsort_rows(order, [m(inputs)["sentence_embedding"][:len(chunk)] for chunk, inputs in batches])
+
+def _lexical_weights(weights, input_ids):
+    """Sparse weights keyed by token id string, keeping each id's max positive weight"""
+    result = {}
+    # zip stops at the unpadded length of input_ids
+    for weight, token_id in zip(weights.tolist(), input_ids):
+        if weight > 0 and token_id not in special_token_ids:
+            key = str(token_id)
+            if weight > result.get(key, 0.0):
+                result[key] = weight
+    return result
+
+def _encode_flagembedding(m, ids, return_dense, return_sparse):
+    """BGE-M3 forward on pre-tokenized ids: dense rows and lexical weights in input order"""
+    order, batches = _sorted_batches(ids)
+    dense_rows = []
+    sparse = [None] * len(ids)
+    for chunk, inputs in batches:
+        outputs = m.model(inputs, return_dense=return_dense, return_sparse=return_sparse)
+        if return_dense:
+            dense_rows.append(outputs["dense_vecs"])
+        if return_sparse:
+            weights = _to_host(outputs["sparse_vecs"].squeeze(-1).float())
+            for row, i in enumerate(chunk):
+                sparse[i] = _lexical_weights(weights[row], ids[i].tolist())
+    dense = _unsort_rows(order, dense_rows) if return_dense else None
+    return dense, sparse if return_sparse else None
+
+def _to_host(tensor):
+    """Copy an output into a pinned host buffer on COPY_STREAM and wait only for that copy"""
+    if COPY_STREAM is None or tensor.device.type != "cuda":
+        return tensor.cpu().numpy()
+    COPY_STREAM.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(COPY_STREAM):
+        buf = torch.empty(tensor.shape, dtype=tensor.dtype, pin_memory=True)
+        buf.copy_(tensor, non_blocking=True)
+        tensor.record_stream(COPY_STREAM)
+        copy_event = COPY_STREAM.record_event()
+    copy_event.synchronize()
+    return buf.numpy()
+
+def _embedding_fields(embeddings, encoding="float", dtype="float32", quantize=None):
+    """Embeddings as float lists, or base64 of the raw row-major float32/float16/int8 matrix"""
+    if quantize == "int8":
+        # Symmetric per-vector int8: row = q * scale, for native int8 vector DB indexes
+        scales = np.abs(embeddings).max(axis=1, keepdims=True).astype(np.float32) / 127.0
+        scales[scales == 0] = 1.0
+        q = np.clip(np.rint(embeddings / scales), -128, 127).astype(np.int8)
+        return {
+            "embeddings": base64.b64encode(q.tobytes()).decode("ascii"),
+            "shape": list(q.shape),
+            "dtype": "int8",
+            "scales": scales[:, 0].tolist(),
+            "quantization": "per_vector_int8",
+        }
+    if encoding != "base64":
+        return {"embeddings": embeddings.tolist()}
+    # Raw bytes: no per-float Python objects or JSON float formatting
+    wire = np.ascontiguousarray(embeddings, dtype=np.float16 if dtype == "float16" else np.float32)
+    return {
+        "embeddings": base64.b64encode(wire.tobytes()).decode("ascii"),
+        "shape": list(wire.shape),
+        "dtype": str(wire.dtype),
+    }
+
+def _load_onnx():
+    """ONNX Runtime model on CPU, exporting once to ONNX_CACHE_DIR"""
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.intra_op_num_threads = os.cpu_count()
+    so.add_session_config_entry("session.intra_op.allow_spinning", "1")
+
+    if os.path.isdir(ONNX_CACHE_DIR):
+        return ORTModelForFeatureExtraction.from_pretrained(
+            ONNX_CACHE_DIR, provider="CPUExecutionProvider", session_options=so
+        )
+    print(f"[BGE-M3] Exporting to ONNX (cache: {ONNX_CACHE_DIR})")
+    ort_model = ORTModelForFeatureExtraction.from_pretrained(
+        "BAAI/bge-m3", export=True, provider="CPUExecutionProvider", session_options=so
+    )
+    try:
+        ort_model.save_pretrained(ONNX_CACHE_DIR)
+    except OSError as e:
+        print(f"[BGE-M3] Could not cache ONNX export: {e}")
+    return ort_model
+
+def _ensure_fast_tokenizer(m):
+    """Swap in the Rust-backed tokenizer if the loader picked the Python one"""
+    try:
+        if not getattr(m.tokenizer, "is_fast", False):
+            from transformers import AutoTokenizer
+            m.tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3", use_fast=True)
+            print("[BGE-M3] Switched to fast tokenizer")
+    except Exception as e:
+        print(f"[BGE-M3] Could not enable fast tokenizer: {e}")
 
 def load_model():
     """Load BGE-M3 model at startup with fallback"""
-    global model, model_type
+    global model, model_type, model_device, tokenizer, special_token_ids
 
     if model is None:
         device = "cuda" if torch.cuda.is_available() else "cpu"
+        model_device = torch.device(device)
+        quant = QUANT
+        if quant == "int8" and device == "cuda":
+            print("[BGE-M3] int8 is CPU-only, using fp16 on GPU")
+            quant = "fp16"
+        if device == "cpu":
+            if quant == "fp16":
+                print("[BGE-M3] fp16 needs a GPU, using fp32 on CPU")
+                quant = "fp32"
+            torch.set_float32_matmul_precision("high")
+
+        # ONNX Runtime on CPU when enabled; it would regress against FlagEmbedding on GPU
+        if USE_ONNX and device == "cpu":
+            try:
+                print("[BGE-M3] Attempting to load with ONNX Runtime...")
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3", use_fast=True)
+                model = _load_onnx()
+                model_type = 'onnx'
+                print("[BGE-M3] Model loaded with ONNX Runtime on cpu")
+                return model
+            except Exception as e:
+                print(f"[BGE-M3] ONNX Runtime failed: {e}")
 
         # Try FlagEmbedding first (preferred)
         try:
@@ -34,11 +302,21 @@ def load_model():
             from FlagEmbedding import BGEM3FlagModel
             model = BGEM3FlagModel(
                 "BAAI/bge-m3",
-                use_fp16=torch.cuda.is_available(),
+                use_fp16=quant == "fp16" and device == "cuda",
                 device=device
             )
+            if quant == "int8":
+                model.model = _quantize_int8(model.model)
+            # Requests call model.model directly, so place it the way encode() would
+            model.model = model.model.to(device)
+            if quant == "fp16":
+                model.model = model.model.half()
+            model.model.eval()
+            _ensure_fast_tokenizer(model)
+            tokenizer = model.tokenizer
+            special_token_ids = frozenset(tokenizer.all_special_ids)
             model_type = 'flagembedding'
-            print(f"[BGE-M3] Model loaded with FlagEmbedding on {device}")
+            print(f"[BGE-M3] Model loaded with FlagEmbedding on {device} ({quant})")
             return model
         except Exception as e:
             print(f"[BGE-M3] FlagEmbedding failed: {e}")
@@ -48,8 +326,15 @@ def load_model():
             print("[BGE-M3] Attempting fallback to sentence-transformers...")
             from sentence_transformers import SentenceTransformer
             model = SentenceTransformer("BAAI/bge-m3", device=device)
+            if quant == "fp16":
+                model = model.half()
+            elif quant == "int8":
+                model = _quantize_int8(model)
+            model[0].auto_model = _compile(model[0].auto_model)
+            _ensure_fast_tokenizer(model)
+            tokenizer = model.tokenizer
             model_type = 'sentence_transformers'
-            print(f"[BGE-M3] Model loaded with sentence-transformers on {device}")
+            print(f"[BGE-M3] Model loaded with sentence-transformers on {device} ({quant})")
             return model
         except Exception as e:
             print(f"[BGE-M3] sentence-transformers failed: {e}")
@@ -58,14 +343,27 @@ def load_model():
         try:
             print("[BGE-M3] Attempting final fallback to transformers AutoModel with safetensors...")
             from transformers import AutoTokenizer, AutoModel
-            global tokenizer
-            tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3")
+            tokenizer = AutoTokenizer.from_pretrained("BAAI/bge-m3", use_fast=True)
             # Force safetensors loading to bypass CVE-2025-32434
-            model = AutoModel.from_pretrained("BAAI/bge-m3", use_safetensors=True)
+            # Fused SDPA attention: no materialized [B, H, N, N] scores at 8K tokens
+            model = AutoModel.from_pretrained("BAAI/bge-m3", use_safetensors=True, attn_implementation="sdpa")
             model = model.to(device)
+            if quant == "fp16":
+                model = model.half()
+            elif quant == "int8":
+                model = _quantize_int8(model)
+            elif device == "cpu" and _cpu_bf16_supported():
+                # BF16 keeps FP32 range, so no calibration and no fidelity loss like int8
+                model = model.to(torch.bfloat16)
+                torch.set_float32_matmul_precision("medium")
+                quant = "bf16"
             model.eval()
+            if device == "cpu" and quant != "int8":
+                model = _freeze_for_cpu(model)
+            else:
+                model = _compile(model)
             model_type = 'transformers'
-            print(f"[BGE-M3] Model loaded with transformers (safetensors) on {device}")
+            print(f"[BGE-M3] Model loaded with transformers (safetensors) on {device} ({quant})")
             return model
         except Exception as e:
             print(f"[BGE-M3] All model loading attempts failed: {e}")
@@ -73,7 +371,95 @@ def load_model():
 
     return model
 
-def handler(job):
+def _encode(m, texts, max_length, return_dense, return_sparse, return_colbert):
+    """Encode texts, returning dense vectors as an (N, D) array, sparse weights and per-text token counts"""
+    dense_embeddings = None
+    sparse_embeddings = None
+
+    # Tokenize once: the same ids feed the model and the token counts
+    ids = [_tokenize_one(text, max_length) for text in texts]
+    token_counts = [len(i) for i in ids]
+
+    # No autograd tape for any loader; thread-local, so entered in the encode thread
+    with torch.inference_mode():
+        if model_type == 'flagembedding':
+            # ColBERT vectors are not part of the response, so they are not computed
+            dense_embeddings, sparse_embeddings = _encode_flagembedding(m, ids, return_dense, return_sparse)
+
+        elif model_type == 'sentence_transformers':
+            dense_embeddings = _encode_sentence_transformers(m, ids)
+
+        elif model_type in ('onnx', 'transformers'):
+            # Raw transformers or ONNX Runtime - need manual encoding (mean pooling)
+            dense_embeddings = _encode_manual(m, ids)
+
+    if dense_embeddings is not None:
+        dense_embeddings = np.ascontiguousarray(dense_embeddings, dtype=np.float32)
+    return dense_embeddings, sparse_embeddings, token_counts
+
+async def _batch_loop(m):
+    """Collect queued jobs for up to BATCH_WINDOW_MS and encode each option group once"""
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_MS / 1000
+
+        while len(batch) < MAX_CONCURRENCY:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Jobs can share an encode call only if their options match
+        groups = {}
+        for key, texts, future in batch:
+            groups.setdefault(key, []).append((texts, future))
+
+        for key, group in groups.items():
+            combined = [text for texts, _ in group for text in texts]
+            if len(group) > 1:
+                print(f"[BGE-M3] Coalesced {len(group)} jobs ({len(combined)} texts) into one batch")
+            try:
+                dense, sparse, token_counts = await asyncio.to_thread(_encode, m, combined, *key)
+            except Exception as e:
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Scatter rows back to each job by offset
+            offset = 0
+            for texts, future in group:
+                end = offset + len(texts)
+                if not future.done():
+                    future.set_result((
+                        dense[offset:end] if dense is not None else None,
+                        sparse[offset:end] if sparse is not None else None,
+                        token_counts[offset:end],
+                    ))
+                offset = end
+
+async def encode(m, texts, key):
+    """Encode one job's texts, coalescing with concurrent jobs"""
+    global _batch_queue, _batch_task
+
+    if _batch_task is None or _batch_task.done():
+        _batch_queue = asyncio.Queue()
+        _batch_task = asyncio.create_task(_batch_loop(m))
+
+    future = asyncio.get_running_loop().create_future()
+    await _batch_queue.put((key, texts, future))
+    return await future
+
+def concurrency_modifier(current_concurrency):
+    """Accept up to MAX_CONCURRENCY concurrent jobs so they can be coalesced"""
+    return MAX_CONCURRENCY
+
+async def handler(job):
     """
     RunPod handler for BGE-M3 embeddings
 
@@ -85,7 +471,10 @@ def handler(job):
                 "return_dense": true,
                 "return_sparse": false,
                 "return_colbert": false,
-                "max_length": 8192
+                "max_length": 8192,
+                "encoding": "float" | "base64",
+                "dtype": "float32" | "float16",
+                "quantize": "int8"
             }
         }
     }
@@ -97,6 +486,15 @@ def handler(job):
         "tokens_used": 123,
         "model": "BAAI/bge-m3"
     }
+
+    With "encoding": "base64", "embeddings" is a base64 string of the
+    row-major matrix, plus "shape": [N, 1024] and "dtype" ("float32", or
+    "float16" when requested, halving the payload).
+    Decode with np.frombuffer(b64decode(x), dtype=dtype).reshape(shape).
+
+    With "quantize": "int8" (any encoding), "embeddings" is the base64 int8
+    matrix with "dtype": "int8", plus per-row "scales" (row = q * scale) and
+    "quantization": "per_vector_int8".
     """
     try:
         job_input = job.get("input", {})
@@ -115,59 +513,34 @@ def handler(job):
         return_dense = options.get("return_dense", True)
         return_sparse = options.get("return_sparse", False)
         return_colbert = options.get("return_colbert", False)
+        encoding = options.get("encoding", "float")
+        dtype = options.get("dtype", "float32")
+        quantize = options.get("quantize")
 
         # Load model if not already loaded
         m = load_model()
 
-        # Generate embeddings based on model type
-        dense_embeddings = []
-        sparse_embeddings = None
+        # Generate embeddings (dense kept as an (N, D) array)
+        dense_embeddings, sparse_embeddings, token_counts = await encode(
+            m, texts, (max_length, return_dense, return_sparse, return_colbert)
+        )
 
-        if model_type == 'flagembedding':
-            # FlagEmbedding returns dict with dense_vecs
-            embeddings = m.encode(
-                texts,
-                max_length=max_length,
-                return_dense=return_dense,
-                return_sparse=return_sparse,
-                return_colbert_vecs=return_colbert
-            )
-            if return_dense:
-                dense_embeddings = embeddings["dense_vecs"].tolist()
-            if return_sparse and "lexical_weights" in embeddings:
-                sparse_embeddings = embeddings["lexical_weights"]
+        # Exact token count, including special tokens
+        tokens_used = sum(token_counts)
 
-        elif model_type == 'sentence_transformers':
-            # SentenceTransformer returns numpy array directly
-            embeddings = m.encode(texts, convert_to_numpy=True)
-            dense_embeddings = embeddings.tolist()
-
-        elif model_type == 'transformers':
-            # Raw transformers - need manual encoding
-            import torch
-            device = next(m.parameters()).device
-            inputs = tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt").to(device)
-            with torch.no_grad():
-                outputs = m(**inputs)
-                # Mean pooling
-                attention_mask = inputs['attention_mask']
-                token_embeddings = outputs.last_hidden_state
-                input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
-                embeddings = torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
-                dense_embeddings = embeddings.cpu().numpy().tolist()
-
-        # Estimate tokens (rough: 4 chars per token)
-        tokens_used = sum(len(t) // 4 + 1 for t in texts)
+        if dense_embeddings is None:
+            dense_embeddings = np.empty((0, 1024), dtype=np.float32)
 
         result = {
-            "embeddings": dense_embeddings,
-            "dimensions": len(dense_embeddings[0]) if dense_embeddings else 1024,
+            "dimensions": dense_embeddings.shape[1] if len(dense_embeddings) else 1024,
             "tokens_used": tokens_used,
             "model": "BAAI/bge-m3",
             "model_type": model_type,
             "texts_processed": len(texts)
         }
 
+        result.update(_embedding_fields(dense_embeddings, encoding, dtype, quantize))
+
         # Include sparse embeddings if available
         if sparse_embeddings:
             result["sparse_embeddings"] = sparse_embeddings
@@ -181,10 +554,18 @@ def handler(job):
             "traceback": traceback.format_exc()
         }
 
+def warmup():
+    """Run one encode so compilation and CUDA graph capture happen before the first job"""
+    _encode(load_model(), ["warmup"], 512, True, False, False)
+
 # Cold start - preload model
 print("[BGE-M3] Starting cold boot...")
 load_model()
+warmup()
 print("[BGE-M3] Ready to serve requests")
 
 # Start RunPod handler
-runpod.serverless.start({"handler": handler})
+runpod.serverless.start({
+    "handler": handler,
+    "concurrency_modifier": concurrency_modifier,
+})
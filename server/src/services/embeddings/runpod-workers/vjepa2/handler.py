@@ -31,7 +31,9 @@ import numpy as np
 import os
 import cv2
 import tempfile
-from typing import List, Dict, Any, Optional, Tuple
+import functools
+from typing import List, Dict, Any, Optional, Tuple, Union
+from collections import Counter
 from dataclasses import dataclass
 from enum import Enum
 
@@ -55,6 +57,16 @@ VJEPA2_MODEL_ID = "facebook/vjepa2-vitl-fpc64-256"
 DIMENSIONS = 1024
 MAX_FRAMES = 64  # V-JEPA 2's temporal window
 DEFAULT_FPS = 4  # Sample rate for video analysis
+# Device and precision are fixed for the worker's lifetime; resolved once here
+# rather than per request. BF16 weights + autocast on Ampere/Hopper (FP32
+# exponent range, no overflow in the ViT blocks); FP16 on older GPUs; FP32 on CPU
+DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+if DEVICE == "cuda":
+    MODEL_DTYPE = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+else:
+    MODEL_DTYPE = torch.float32
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
 
 
 class AnalysisType(str, Enum):
@@ -98,7 +110,7 @@ def load_model():
     global vjepa2_model, vjepa2_processor
 
     if vjepa2_model is None:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        device = DEVICE
         print(f"[V-JEPA 2] Loading {VJEPA2_MODEL_ID} on {device}...")
 
         try:
@@ -116,7 +128,7 @@ def load_model():
                 vjepa2_model = AutoModel.from_pretrained(
                     VJEPA2_MODEL_ID,
                     trust_remote_code=True,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+                    torch_dtype=MODEL_DTYPE,
                     use_safetensors=True
                 )
                 vjepa2_model = vjepa2_model.to(device)
@@ -128,13 +140,14 @@ def load_model():
                 print(f"[V-JEPA 2] Loading VideoMAE as temporal backbone...")
 
                 # Fallback to VideoMAE which has similar temporal understanding
-                from transformers import VideoMAEForVideoClassification, VideoMAEImageProcessor
+                # Bare encoder: its last_hidden_state is all we use (no classifier head)
+                from transformers import VideoMAEModel, VideoMAEImageProcessor
 
                 FALLBACK_MODEL = "MCG-NJU/videomae-large"
                 vjepa2_processor = VideoMAEImageProcessor.from_pretrained(FALLBACK_MODEL)
-                vjepa2_model = VideoMAEForVideoClassification.from_pretrained(
+                vjepa2_model = VideoMAEModel.from_pretrained(
                     FALLBACK_MODEL,
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+                    torch_dtype=MODEL_DTYPE,
                     use_safetensors=True
                 )
                 vjepa2_model = vjepa2_model.to(device)
@@ -145,9 +158,29 @@ def load_model():
             print(f"[V-JEPA 2] All model loading failed: {e}")
             raise RuntimeError(f"Failed to load temporal video model: {e}")
 
+        if device == "cuda":
+            vjepa2_model = compile_model(vjepa2_model, vjepa2_processor)
+
     return vjepa2_model, vjepa2_processor
 
 
+def compile_model(model, processor):
+    """torch.compile for the fixed [1, 16, 3, H, W] input; stays eager if compilation fails"""
+    compiled = torch.compile(model, mode="reduce-overhead", fullgraph=False, dynamic=False)
+    try:
+        # Warm up through the request path so compilation and CUDA graph
+        # capture happen at container init, not on the first request
+        height, width = frame_size(processor)
+        dummy_frames = [np.zeros((height, width, 3), dtype=np.uint8)] * 16
+        for _ in range(3):
+            compute_temporal_embedding(compiled, processor, dummy_frames, "cuda")
+        print("[V-JEPA 2] Model compiled with torch.compile")
+        return compiled
+    except Exception as e:
+        print(f"[V-JEPA 2] torch.compile failed, staying eager: {e}")
+        return model
+
+
 def decode_image(image_data: str) -> Image.Image:
     """Decode image from base64 or URL"""
     if image_data.startswith("http://") or image_data.startswith("https://"):
@@ -161,6 +194,48 @@ def decode_image(image_data: str) -> Image.Image:
         return Image.open(io.BytesIO(image_bytes)).convert("RGB")
 
 
+def sample_frames_decord(source: Union[str, io.BytesIO], max_frames: int, fps: int) -> List[np.ndarray]:
+    """Fetch every (video_fps / fps)-th frame in one get_batch call, as RGB arrays"""
+    from decord import VideoReader
+
+    # decord reads file-like objects from memory, so downloads never touch disk
+    vr = VideoReader(source)
+    frame_interval = max(1, int((vr.get_avg_fps() or 30) / fps))
+    indices = list(range(0, len(vr), frame_interval))[:max_frames]
+    if not indices:
+        return []
+    return list(vr.get_batch(indices).asnumpy())
+
+
+def sample_frames_opencv(video_path: str, max_frames: int, fps: int) -> List[np.ndarray]:
+    """OpenCV fallback: grab() skipped frames, retrieve() and convert only sampled ones"""
+    frames = []
+    cap = cv2.VideoCapture(video_path)
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    # Calculate frame sampling
+    target_frame_count = min(max_frames, total_frames)
+    frame_interval = max(1, int(video_fps / fps))
+
+    frame_idx = 0
+    while len(frames) < target_frame_count:
+        if not cap.grab():
+            break
+
+        if frame_idx % frame_interval == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            # Convert BGR to RGB
+            frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+        frame_idx += 1
+
+    cap.release()
+    return frames
+
+
 def decode_video(video_data: str, max_frames: int = MAX_FRAMES, fps: int = DEFAULT_FPS) -> List[np.ndarray]:
     """
     Extract frames from video file/URL/base64.
@@ -172,50 +247,34 @@ def decode_video(video_data: str, max_frames: int = MAX_FRAMES, fps: int = DEFAU
     try:
         # Handle different video input types
         if video_data.startswith("http://") or video_data.startswith("https://"):
-            # Download video to temp file
+            # Download video into memory
             response = http_requests.get(video_data, timeout=120, stream=True)
             response.raise_for_status()
-            temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-            for chunk in response.iter_content(chunk_size=8192):
-                temp_file.write(chunk)
-            temp_file.close()
-            video_path = temp_file.name
+            source = io.BytesIO()
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                source.write(chunk)
+            source.seek(0)
         elif video_data.startswith("data:") or len(video_data) > 1000:
             # Base64 encoded video
             if "base64," in video_data:
                 video_data = video_data.split("base64,")[1]
-            video_bytes = base64.b64decode(video_data)
-            temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
-            temp_file.write(video_bytes)
-            temp_file.close()
-            video_path = temp_file.name
+            source = io.BytesIO(base64.b64decode(video_data))
         else:
             # Assume it's a file path
-            video_path = video_data
-
-        # Extract frames using OpenCV
-        cap = cv2.VideoCapture(video_path)
-        video_fps = cap.get(cv2.CAP_PROP_FPS) or 30
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        # Calculate frame sampling
-        target_frame_count = min(max_frames, total_frames)
-        frame_interval = max(1, int(video_fps / fps))
-
-        frame_idx = 0
-        while len(frames) < target_frame_count:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            if frame_idx % frame_interval == 0:
-                # Convert BGR to RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frames.append(frame_rgb)
-
-            frame_idx += 1
+            source = video_data
 
-        cap.release()
+        # Extract frames with decord, decoding only the sampled frames
+        try:
+            frames = sample_frames_decord(source, max_frames, fps)
+        except Exception as e:
+            print(f"[V-JEPA 2] decord failed ({e}), falling back to OpenCV")
+            if isinstance(source, io.BytesIO):
+                # OpenCV only opens paths; spill to a temp file just for this fallback
+                temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+                temp_file.write(source.getbuffer())
+                temp_file.close()
+                source = temp_file.name
+            frames = sample_frames_opencv(source, max_frames, fps)
 
     finally:
         # Clean up temp file
@@ -235,21 +294,66 @@ def decode_frame_sequence(frames_data: List[str]) -> List[np.ndarray]:
     return frames
 
 
+def frame_size(processor) -> Tuple[int, int]:
+    """(height, width) the model expects, from the processor's crop size"""
+    crop = getattr(processor, "crop_size", None) or {}
+    return crop.get("height", 224), crop.get("width", 224)
+
+
+@functools.lru_cache(maxsize=4)
+def normalization_tensors(processor, device: str, dtype: torch.dtype) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Processor mean/std as [1, 3, 1, 1] tensors, created once per device/dtype"""
+    mean = getattr(processor, "image_mean", None) or IMAGENET_MEAN
+    std = getattr(processor, "image_std", None) or IMAGENET_STD
+    return (
+        torch.tensor(mean, device=device, dtype=dtype).view(1, 3, 1, 1),
+        torch.tensor(std, device=device, dtype=dtype).view(1, 3, 1, 1),
+    )
+
+
+def preprocess_frames(
+    processor,
+    frames: List[np.ndarray],
+    device: str,
+    dtype: torch.dtype
+) -> torch.Tensor:
+    """
+    Turn uint8 RGB frames into the normalized [1, T, 3, H, W] video tensor.
+    Frames go to the device as raw uint8 and are resized/normalized there.
+    """
+    arrays = [np.asarray(f, dtype=np.uint8) for f in frames]
+    # One host->device copy when all frames share a shape (the usual case for video)
+    if all(a.shape == arrays[0].shape for a in arrays):
+        chunks = [torch.from_numpy(np.stack(arrays))]
+    else:
+        chunks = [torch.from_numpy(np.ascontiguousarray(a)).unsqueeze(0) for a in arrays]
+
+    resized = []
+    for chunk in chunks:
+        if device.startswith("cuda"):
+            chunk = chunk.pin_memory()
+        chunk = chunk.to(device, non_blocking=True).permute(0, 3, 1, 2).to(dtype).div_(255.0)
+        resized.append(F.interpolate(chunk, size=frame_size(processor), mode="bilinear", align_corners=False, antialias=True))
+
+    video = torch.cat(resized)
+    mean, std = normalization_tensors(processor, device, dtype)
+    video.sub_(mean).div_(std)
+    return video.unsqueeze(0)
+
+
 def compute_temporal_embedding(
     model,
     processor,
     frames: List[np.ndarray],
     device: str
-) -> Tuple[np.ndarray, List[np.ndarray]]:
+) -> Tuple[np.ndarray, np.ndarray]:
     """
     Compute temporal embedding from video frames.
-    Returns (aggregated_embedding, per_frame_embeddings)
+    Returns (aggregated_embedding, per_frame_embeddings), the latter as an
+    unnormalized [T, D] float32 matrix of raw hidden-state rows.
     """
-    # Get model dtype for proper casting
-    model_dtype = next(model.parameters()).dtype
-
-    with torch.no_grad():
-        # VideoMAE expects [batch, channels, frames, height, width]
+    with torch.no_grad(), torch.autocast(device_type="cuda", dtype=MODEL_DTYPE, enabled=device.startswith("cuda")):
+        # VideoMAE expects [batch, frames, channels, height, width]
 
         # Ensure we have 16 frames (VideoMAE's expected input)
         frame_list = list(frames)
@@ -257,74 +361,31 @@ def compute_temporal_embedding(
             frame_list.append(frame_list[-1])
         frame_list = frame_list[:16]
 
-        # Convert to PIL Images for processor
-        pil_frames = []
-        for f in frame_list:
-            if isinstance(f, np.ndarray):
-                pil_frames.append(Image.fromarray(f.astype(np.uint8)))
-            else:
-                pil_frames.append(f)
-
-        # Use the processor - VideoMAEImageProcessor expects a list of lists for video
-        try:
-            # VideoMAE processor expects list of frames
-            inputs = processor(pil_frames, return_tensors="pt")
-        except Exception as e:
-            print(f"[V-JEPA 2] Processor call failed: {e}, using manual preprocessing")
-            # Manual preprocessing fallback
-            from torchvision import transforms
-            transform = transforms.Compose([
-                transforms.Resize((224, 224)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ])
-
-            frame_tensors = [transform(f) for f in pil_frames]
-            # Stack: [16, 3, 224, 224] -> [3, 16, 224, 224] -> [1, 3, 16, 224, 224]
-            video_tensor = torch.stack(frame_tensors)  # [16, 3, 224, 224]
-            video_tensor = video_tensor.permute(1, 0, 2, 3).unsqueeze(0)  # [1, 3, 16, 224, 224]
-            inputs = {"pixel_values": video_tensor}
-
-        # Move to device and cast to model dtype (fp16/fp32)
-        inputs = {
-            k: v.to(device=device, dtype=model_dtype) if isinstance(v, torch.Tensor) else v
-            for k, v in inputs.items()
-        }
-
-        # Get model outputs
-        outputs = model(**inputs, output_hidden_states=True)
-
-        # Extract embeddings from hidden states
-        if hasattr(outputs, 'hidden_states') and outputs.hidden_states:
-            # Use last hidden state
-            hidden = outputs.hidden_states[-1]  # [batch, seq_len, hidden_dim]
-
-            # Temporal pooling - mean over sequence
-            temporal_embedding = hidden.mean(dim=1).squeeze().cpu().numpy()
-
-            # Per-frame embeddings (reshape if needed)
-            frame_count = len(frames)
-            per_frame = hidden.squeeze().cpu().numpy()
-
-            # Ensure we have per-frame embeddings
-            if len(per_frame.shape) > 1:
-                # Interpolate to match input frame count
-                per_frame_embeddings = []
-                seq_len = per_frame.shape[0]
-                for i in range(frame_count):
-                    idx = min(int(i * seq_len / frame_count), seq_len - 1)
-                    per_frame_embeddings.append(per_frame[idx])
-            else:
-                per_frame_embeddings = [temporal_embedding] * frame_count
-
-        elif hasattr(outputs, 'last_hidden_state'):
-            hidden = outputs.last_hidden_state
-            temporal_embedding = hidden.mean(dim=(1, 2)).squeeze().cpu().numpy()
-            per_frame_embeddings = [temporal_embedding] * len(frames)
+        # Frames are already RGB arrays: build the processor's [1, T, 3, H, W]
+        # layout directly instead of a PIL round-trip per frame
+        input_name = (getattr(processor, "model_input_names", None) or ["pixel_values"])[0]
+        # FP32 input; autocast casts it at the first matmul/conv
+        inputs = {input_name: preprocess_frames(processor, frame_list, device, torch.float32)}
+
+        # Get model outputs; only the final layer is kept, not every layer's hidden states
+        outputs = model(**inputs)
+        hidden = outputs.last_hidden_state  # [batch, seq_len, hidden_dim]
+
+        # Temporal pooling - mean over sequence
+        temporal_embedding = hidden.mean(dim=1).squeeze().float().cpu().numpy()
+
+        # Per-frame embeddings (reshape if needed)
+        frame_count = len(frames)
+        per_frame = hidden.squeeze().float().cpu().numpy()
+
+        # Ensure we have per-frame embeddings
+        if len(per_frame.shape) > 1:
+            # Interpolate to match input frame count: one gather of evenly spaced rows
+            seq_len = per_frame.shape[0]
+            idx = np.minimum(np.arange(frame_count) * seq_len // frame_count, seq_len - 1)
+            per_frame_embeddings = per_frame[idx]
         else:
-            # Fallback to logits
-            temporal_embedding = outputs.logits.squeeze().cpu().numpy()
-            per_frame_embeddings = [temporal_embedding] * len(frames)
+            per_frame_embeddings = [temporal_embedding] * frame_count
 
         # Normalize to 1024 dimensions
         if len(temporal_embedding) != DIMENSIONS:
@@ -336,7 +397,9 @@ def compute_temporal_embedding(
         # Normalize embeddings
         temporal_embedding = temporal_embedding / (np.linalg.norm(temporal_embedding) + 1e-8)
 
-        return temporal_embedding, per_frame_embeddings
+        # Rows stay unnormalized: clients receive them as-is and the magnitude
+        # thresholds downstream are tuned for raw hidden-state norms
+        return temporal_embedding, np.asarray(per_frame_embeddings, dtype=np.float32)
 
 
 def detect_key_moments(
@@ -348,33 +411,28 @@ def detect_key_moments(
     Large changes indicate significant events (errors, pivots, breakthroughs).
     """
     key_moments = []
-    similarities = []
-
-    for i in range(1, len(frame_embeddings)):
-        prev_emb = np.array(frame_embeddings[i-1])
-        curr_emb = np.array(frame_embeddings[i])
-
-        # Normalize
-        prev_norm = prev_emb / (np.linalg.norm(prev_emb) + 1e-8)
-        curr_norm = curr_emb / (np.linalg.norm(curr_emb) + 1e-8)
-
-        # Cosine similarity
-        similarity = float(np.dot(prev_norm, curr_norm))
-        similarities.append(similarity)
-
-        # Detect significant changes
-        change = 1 - similarity
-        if change > threshold:
-            moment_type = classify_moment_type(change, i, len(frame_embeddings))
-            key_moments.append({
-                "frame_index": i,
-                "timestamp": i / DEFAULT_FPS,
-                "type": moment_type,
-                "description": f"Significant change detected (delta: {change:.3f})",
-                "confidence": min(change / 0.5, 1.0)
-            })
+    if len(frame_embeddings) < 2:
+        return key_moments, []
+
+    # Cosine similarity of each consecutive pair, all at once
+    E = np.asarray(frame_embeddings, dtype=np.float32)
+    E = E / (np.linalg.norm(E, axis=1, keepdims=True) + 1e-8)
+    similarities = np.einsum('ij,ij->i', E[:-1], E[1:])
+    changes = 1.0 - similarities
+
+    # Detect significant changes
+    for i in (np.flatnonzero(changes > threshold) + 1).tolist():
+        change = float(changes[i - 1])
+        moment_type = classify_moment_type(change, i, len(frame_embeddings))
+        key_moments.append({
+            "frame_index": i,
+            "timestamp": i / DEFAULT_FPS,
+            "type": moment_type,
+            "description": f"Significant change detected (delta: {change:.3f})",
+            "confidence": min(change / 0.5, 1.0)
+        })
 
-    return key_moments, similarities
+    return key_moments, similarities.tolist()
 
 
 def classify_moment_type(change: float, frame_idx: int, total_frames: int) -> str:
@@ -397,29 +455,29 @@ def detect_patterns(
     patterns = []
 
     # Pattern: Steady progress (low variance in embeddings)
-    embedding_variance = np.var([np.mean(e) for e in frame_embeddings])
+    embedding_variance = np.var(np.mean(np.asarray(frame_embeddings, dtype=np.float32), axis=1))
     if embedding_variance < 0.1:
         patterns.append("steady_progress")
 
+    # One pass over the moments: counts per type, plus the earliest error and latest success
+    type_counts = Counter(m["type"] for m in key_moments)
+    first_error = min((m["frame_index"] for m in key_moments if m["type"] == "error"), default=None)
+    last_success = max((m["frame_index"] for m in key_moments if m["type"] == "success"), default=None)
+
     # Pattern: Trial and error (multiple pivots)
-    pivot_count = sum(1 for m in key_moments if m["type"] == "pivot")
-    if pivot_count > 2:
+    if type_counts["pivot"] > 2:
         patterns.append("trial_and_error")
 
-    # Pattern: Error recovery
-    error_moments = [m for m in key_moments if m["type"] == "error"]
-    success_moments = [m for m in key_moments if m["type"] == "success"]
-    if error_moments and success_moments:
-        if any(s["frame_index"] > e["frame_index"] for e in error_moments for s in success_moments):
-            patterns.append("error_recovery")
+    # Pattern: Error recovery (some success after some error)
+    if first_error is not None and last_success is not None and last_success > first_error:
+        patterns.append("error_recovery")
 
     # Pattern: Frustration loop
-    frustration_count = sum(1 for m in key_moments if m["type"] == "frustration")
-    if frustration_count > 3:
+    if type_counts["frustration"] > 3:
         patterns.append("frustration_loop")
 
     # Pattern: Breakthrough
-    if any(m["type"] == "breakthrough" for m in key_moments):
+    if type_counts["breakthrough"]:
         patterns.append("breakthrough_achieved")
 
     return patterns
@@ -465,22 +523,17 @@ def verify_demo(
 
 def analyze_conversation_flow(
     screenshots: List[np.ndarray],
-    model,
-    processor,
-    device: str
+    temporal_embedding: np.ndarray,
+    frame_embeddings: np.ndarray,
+    key_moments: List[Dict],
+    similarities: List[float],
+    patterns: List[str]
 ) -> Dict[str, Any]:
     """
     Analyze conversation flow from screenshots (for Fix My App).
     Detects: errors shown, user frustration, AI responses, code blocks, etc.
+    Reuses the handler's embeddings and key moments instead of a second forward pass.
     """
-    # Compute temporal embedding
-    temporal_embedding, frame_embeddings = compute_temporal_embedding(
-        model, processor, screenshots, device
-    )
-
-    # Detect key moments in conversation
-    key_moments, similarities = detect_key_moments(frame_embeddings)
-
     # Conversation-specific analysis
     conversation_analysis = {
         "temporal_embedding": temporal_embedding.tolist(),
@@ -492,7 +545,7 @@ def analyze_conversation_flow(
             "pivot_points": [m for m in key_moments if m["type"] == "pivot"],
             "resolution_points": [m for m in key_moments if m["type"] in ["success", "breakthrough"]]
         },
-        "patterns": detect_patterns(frame_embeddings, key_moments),
+        "patterns": patterns,
         "recommendations": []
     }
 
@@ -529,9 +582,6 @@ def predict_next_action(
     recent = np.array(frame_embeddings[-3:]) if len(frame_embeddings) >= 3 else np.array(frame_embeddings)
     trajectory = np.mean(np.diff(recent, axis=0), axis=0)
 
-    # Normalize trajectory
-    trajectory_norm = trajectory / (np.linalg.norm(trajectory) + 1e-8)
-
     # Predict based on trajectory magnitude and direction
     trajectory_magnitude = np.linalg.norm(trajectory)
 
@@ -544,7 +594,7 @@ def predict_next_action(
 
     if trajectory_magnitude > 0.3:
         predictions["predicted_action"] = "major_change_coming"
-        predictions["confidence"] = min(trajectory_magnitude, 0.9)
+        predictions["confidence"] = float(min(trajectory_magnitude, 0.9))
     elif trajectory_magnitude < 0.05:
         predictions["predicted_action"] = "task_completion"
         predictions["confidence"] = 0.7
@@ -765,8 +815,6 @@ def anticipate_error(
     else:
         trajectory = frame_embeddings[-1] - frame_embeddings[0]
 
-    trajectory_norm = trajectory / (np.linalg.norm(trajectory) + 1e-8)
-
     # Key metric: Is the trajectory moving TOWARD or AWAY from intent?
     current_intent_similarity = float(np.dot(current_norm, intent_norm))
 
@@ -879,7 +927,7 @@ def handler(job):
 
         # Load model
         model, processor = load_model()
-        device = next(model.parameters()).device
+        device = DEVICE
 
         # Extract frames from input
         frames_input = job_input.get("frames") or job_input.get("video")
@@ -904,7 +952,7 @@ def handler(job):
 
         # Compute temporal embeddings
         temporal_embedding, frame_embeddings = compute_temporal_embedding(
-            model, processor, frames, str(device)
+            model, processor, frames, device
         )
 
         # Detect key moments
@@ -932,7 +980,7 @@ def handler(job):
 
         elif analysis_type == AnalysisType.DEMO_VERIFICATION.value:
             expected = job_input.get("expected_behaviors", [])
-            verification = verify_demo(frame_embeddings, expected, model, processor, str(device))
+            verification = verify_demo(frame_embeddings, expected, model, processor, device)
             result["verification"] = verification
             result["confidence"] = verification["confidence"]
 
@@ -943,7 +991,9 @@ def handler(job):
             result["confidence"] = prediction["confidence"]
 
         elif analysis_type == AnalysisType.CONVERSATION_FLOW.value:
-            conversation = analyze_conversation_flow(frames, model, processor, str(device))
+            conversation = analyze_conversation_flow(
+                frames, temporal_embedding, frame_embeddings, key_moments, frame_similarities, patterns
+            )
             result["conversation_analysis"] = conversation
             result["recommendations"] = conversation.get("recommendations", [])
 
@@ -982,7 +1032,7 @@ def handler(job):
                 return {"error": "code_description required for predict_state"}
 
             prediction = predict_ui_state(
-                frame_embeddings, code_description, model, processor, str(device)
+                frame_embeddings, code_description, model, processor, device
             )
             result["state_prediction"] = prediction
             result["confidence"] = prediction["confidence"]
@@ -994,7 +1044,7 @@ def handler(job):
                 return {"error": "expected_transition required for validate_transition"}
 
             validation = validate_transition(
-                frame_embeddings, expected_transition, model, processor, str(device)
+                frame_embeddings, expected_transition, model, processor, device
             )
             result["validation"] = validation
             result["confidence"] = validation["confidence"]
@@ -1008,7 +1058,7 @@ def handler(job):
                 return {"error": "intent_embedding required for anticipate_error"}
 
             anticipation = anticipate_error(
-                frame_embeddings, intent_embedding, intent_checklist, model, processor, str(device)
+                frame_embeddings, intent_embedding, intent_checklist, model, processor, device
             )
             result["error_anticipation"] = anticipation
             result["confidence"] = anticipation["confidence"]
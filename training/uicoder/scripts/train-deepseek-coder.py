@@ -45,8 +45,10 @@ os.system("df -h /workspace | tail -1 | awk '{print $4}'")
 
 # Now import everything else
 import argparse
+import functools
 import json
 import os
+import shutil
 import subprocess
 from dataclasses import dataclass
 from pathlib import Path
@@ -617,6 +619,13 @@ def generate_code(model_path: str, prompt: dict) -> str:
     return "// Generated code placeholder"
 
 
+@functools.lru_cache(maxsize=1)
+def _tsc_command() -> tuple:
+    """Resolve the tsc binary once; going through npx costs an extra node startup per call."""
+    tsc = shutil.which("tsc")
+    return (tsc,) if tsc else ("npx", "tsc")
+
+
 def validate_typescript(code: str) -> bool:
     """Validate that TypeScript code compiles."""
     try:
@@ -627,7 +636,7 @@ def validate_typescript(code: str) -> bool:
 
         # Run tsc
         result = subprocess.run(
-            ["npx", "tsc", "--noEmit", temp_file],
+            [*_tsc_command(), "--noEmit", temp_file],
             capture_output=True,
             timeout=30,
         )